@@ -1,18 +1,34 @@
-﻿from flask import Flask, request, abort
+﻿from flask import Flask, Response, request, abort, jsonify
 from linebot import LineBotApi, WebhookHandler
-from linebot.exceptions import InvalidSignatureError
+from linebot.exceptions import InvalidSignatureError, LineBotApiError
 from linebot.models import MessageEvent, TextMessage, TextSendMessage
-import gradio as gr
-import requests
 import os
 import pandas as pd
-from qdrant_client import QdrantClient
 from qdrant_client.http import models
-from qdrant_client.http.models import PointStruct, VectorParams, Distance
-from sentence_transformers import SentenceTransformer
 import threading
-import csv
+import time
+import logging
+import random
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List, Optional
 from datetime import datetime
+from answer_cache import AnswerCache, is_error_answer
+from chat_ingestor import ChatLogIngestor
+from chatlog_maintenance import ChatLogMaintainer
+from chatlog_store import DEFAULT_DB_PATH, TIMESTAMP_FORMAT, ChatLogStore
+from context_builder import ContextBuilder, Passage
+from embedding_cache import EmbeddingStore
+from encoders import load_encoder
+from line_dispatcher import LineDispatcher
+from local_index import LocalCollectionIndex
+from qdrant_collections import CHATLOG_COLLECTION, DOCUMENTS_ALIAS, FAQ_ALIAS, bootstrap_alias
+from qdrant_provision import get_client, profile_for, search_params
+from llm_scheduler import GenerationFailed, LLMScheduler, SchedulerBusy
+from lmstudio_client import probe_lmstudio, stream_lmstudio
+from service_health import HealthRegistry
+import metrics
 
 # 讀取環境變數（或直接貼上你的 Token 與 Secret）
 LINE_CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN", "fMbCvIudIk+Qzafcx2N8QvOkb/2rmSdw+wWTwdX7zhzz7dndEuGooi4YljZOi304Bek7QghN0qp6hMZy5Zuhqjzhc4+OUSdydqevK/YO7G8OIwLZ1Ya+eWAbg1sdhNNtykvKokCdYLcSPmHx3rt2ewdB04t89/1O/w1cDnyilFU=")
@@ -20,10 +36,40 @@ LINE_CHANNEL_SECRET = os.getenv("LINE_CHANNEL_SECRET", "113f99564b7941732e96c4fd
 
 app = Flask(__name__)
 
-line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN)
+# 除錯用的追蹤訊息：只有 logger 開啟 DEBUG 時才輸出，且只抽樣 TRACE_SAMPLE_RATE 比例的請求
+logger = logging.getLogger("rag")
+TRACE_SAMPLE_RATE = float(os.getenv("RAG_TRACE_SAMPLE_RATE", "0.1"))
+
+def trace(message, *args):
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < TRACE_SAMPLE_RATE:
+        logger.debug(message, *args)
+
+# 各階段耗時與命中次數（/metrics）
+metrics.describe("rag_stage_seconds", "RAG 各階段耗時（秒）")
+metrics.describe("rag_search_seconds", "各 collection 向量搜尋耗時（秒）")
+metrics.describe("rag_search_errors_total", "查詢 Qdrant 失敗（視為沒有結果）的次數")
+metrics.describe("rag_llm_seconds", "LLM 生成耗時（秒），phase=first_token / total")
+metrics.describe("rag_llm_queue_seconds", "LLM 生成在排程器中排隊等待的時間（秒）")
+metrics.describe("rag_llm_scheduler_total", "LLM 排程器的請求數，result=submitted / coalesced / rejected / expired / failed")
+metrics.describe("rag_threshold_total", "FAQ / ChatLog 相似度是否達門檻的次數")
+metrics.describe("rag_requests_total", "對話請求數，依結果分類")
+metrics.describe("rag_context_dropped_total", "組合參考內容時略過的段落數，reason=duplicate / budget")
+metrics.describe("rag_chat_history_inserted_total", "寫入 chat_history（Qdrant）的筆數")
+metrics.describe("rag_chat_history_deduplicated_total", "寫入 chat_history 時因問題重複而更新既有 point 的筆數")
+metrics.describe("rag_chat_history_dropped_total", "chat_history 寫入佇列已滿而略過的筆數")
+metrics.describe("rag_chatlog_written_total", "寫入問答紀錄資料庫的筆數")
+metrics.describe("rag_chatlog_dropped_total", "問答紀錄佇列已滿而略過的筆數")
+
+# LINE API 位址：本地測試時可指向 line_api_stub.py（例如 http://127.0.0.1:8081）
+LINE_API_ENDPOINT = os.getenv("LINE_API_ENDPOINT", "https://api.line.me")
+REPLY_TOKEN_TTL = 50  # reply token 有效時間有限，處理超過此秒數就直接改用 push
+BUSY_MESSAGE = "⏳ 目前詢問人數較多，請稍後再試一次。"
+
+line_bot_api = LineBotApi(LINE_CHANNEL_ACCESS_TOKEN, endpoint=LINE_API_ENDPOINT)
 handler = WebhookHandler(LINE_CHANNEL_SECRET)
 
 # Webhook 路徑，LINE 會把使用者訊息 POST 到這裡
+# 只驗證簽章並把事件交給背景處理池，立刻回傳 "OK"
 @app.route("/callback", methods=["POST"])
 def callback():
     signature = request.headers["X-Line-Signature"]
@@ -34,221 +80,544 @@ def callback():
         abort(400)
     return "OK"
 
-# 接收文字訊息
+# 接收文字訊息：放進背景處理池（已處理過的重送事件會被丟棄）
 @handler.add(MessageEvent, message=TextMessage)
 def handle_message(event):
+    status = line_dispatcher.submit(event)
+    if status == "busy":
+        # 處理池已滿 → 直接回覆忙碌訊息，不讓請求堆積
+        try:
+            line_bot_api.reply_message(event.reply_token, TextSendMessage(text=BUSY_MESSAGE))
+        except LineBotApiError as e:
+            print(f"❗ 回覆忙碌訊息失敗：{e}")
+
+# 背景處理一則文字訊息：產生回答後優先用 reply，reply token 過期或失敗時改用 push
+def answer_line_event(event, received_at):
     user_text = event.message.text
     answer = chat(user_text)  # 呼叫你的 LLM 問答系統
-    line_bot_api.reply_message(
-        event.reply_token,
-        TextSendMessage(text=answer)
-    )
+    message = TextSendMessage(text=answer)
+    user_id = getattr(event.source, "user_id", None)
+
+    if time.monotonic() - received_at < REPLY_TOKEN_TTL:
+        try:
+            line_bot_api.reply_message(event.reply_token, message)
+            return
+        except LineBotApiError as e:
+            print(f"❗ reply 失敗，改用 push：{e}")
+    if user_id is None:
+        raise RuntimeError("reply token 已失效且事件沒有 user_id，無法送出回答")
+    line_bot_api.push_message(user_id, message)
+
+line_dispatcher = LineDispatcher(answer_line_event, max_workers=4, max_queue=100).start()
+
+# 向量快取的命中狀況
+@app.route("/embeddings/stats", methods=["GET"])
+def embedding_stats():
+    if _searcher is None:
+        return jsonify({"loaded": False})
+    return jsonify(_searcher.embeddings.stats())
+
+# Prometheus 文字格式的效能統計
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+# 回答快取的命中狀況
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify(answer_cache.stats())
+
+# LINE 背景處理池的狀態（排隊數、處理中數量、拒收與重複事件數）
+@app.route("/line/stats", methods=["GET"])
+def line_stats():
+    return jsonify(line_dispatcher.stats())
+
+# 問答紀錄的寫入狀態（佇列中筆數、資料庫筆數）
+@app.route("/chatlog/stats", methods=["GET"])
+def chatlog_stats():
+    stats = get_chatlog_store().stats()
+    stats["maintenance"] = _chatlog_maintainer.last_result if _chatlog_maintainer else None
+    return jsonify(stats)
+
+# LLM 排程器的狀態（排隊數、生成中數量、共用生成次數、排隊等待時間）
+@app.route("/llm/stats", methods=["GET"])
+def llm_stats():
+    return jsonify(llm_scheduler.stats())
+
+# 各 collection 名稱與相似度門檻（名稱集中在 qdrant_collections.py，FAQ 與文件段落透過 alias 查詢）
+FAQ_COLLECTION = FAQ_ALIAS
+CHATLOG_DB_PATH = os.getenv("CHATLOG_DB_PATH", DEFAULT_DB_PATH)
+# chat_history 的大小控制：幾乎相同的問題只更新既有 point，並定期刪除過舊 / 超量的問答、合併重複問題
+CHATLOG_DUPLICATE_THRESHOLD = float(os.getenv("CHATLOG_DUPLICATE_THRESHOLD", "0.95"))
+CHATLOG_MAX_AGE_DAYS = float(os.getenv("CHATLOG_MAX_AGE_DAYS", "180"))
+CHATLOG_MAX_POINTS = int(os.getenv("CHATLOG_MAX_POINTS", "20000"))
+CHATLOG_MAINTENANCE_INTERVAL = float(os.getenv("CHATLOG_MAINTENANCE_INTERVAL", "3600"))
+SCORE_THRESHOLD = 0.60  # 低於此分數視為不相關
+
+# 單筆搜尋結果：text 為要使用的文字欄位，score 為相似度分數，vector 為該筆資料在 collection 中的向量
+@dataclass
+class SearchHit:
+    text: str
+    score: float
+    payload: dict = field(default_factory=dict)
+    vector: Optional[list] = None
+
+# 一次檢索的整體結果（FAQ / 原始段落 / ChatLog），保留分數供後續判斷
+@dataclass
+class RetrievalResult:
+    faq: Optional[SearchHit] = None  # FAQ 最相近的一筆（不論分數）
+    paragraphs: List[SearchHit] = field(default_factory=list)
+    chatlog: Optional[SearchHit] = None  # ChatLog 最相近的一筆（不論分數）
+    vector: Optional[list] = None  # 問題的向量，寫入 chat_history 時可重複使用
+
+    # 分數達門檻才回傳 FAQ 答案
+    @property
+    def faq_answer(self):
+        if self.faq and self.faq.score >= SCORE_THRESHOLD:
+            return self.faq.text
+        return None
+
+    # 分數達門檻才回傳 ChatLog 答案
+    @property
+    def chatlog_answer(self):
+        if self.chatlog and self.chatlog.score >= SCORE_THRESHOLD:
+            return self.chatlog.text
+        return None
+
+    @property
+    def paragraph_texts(self):
+        return [p.text for p in self.paragraphs]
+
+    # 可放進參考內容的段落（FAQ / ChatLog 需達門檻，原始段落全部保留），交給 ContextBuilder 去重與挑選
+    # FAQ / ChatLog 的向量是問題的向量，不是答案的，留給 ContextBuilder 以答案文字計算
+    def passages(self) -> List[Passage]:
+        passages = []
+        if self.faq_answer:
+            passages.append(Passage("faq", self.faq.text, self.faq.score))
+        passages.extend(Passage("paragraph", p.text, p.score, p.vector) for p in self.paragraphs)
+        if self.chatlog_answer:
+            passages.append(Passage("chatlog", self.chatlog.text, self.chatlog.score))
+        return passages
+
+QDRANT_SEARCH_WORKERS = int(os.getenv("QDRANT_SEARCH_WORKERS", "8"))
 
 # 向量搜尋器，設定相關參數
 class QdrantSearcher:
-    # collection_name：欲使用的向量資料庫名稱
+    # collection_name：欲使用的向量資料庫名稱（alias，重建時由 qdrant_ingest.py 切換到新版本）
     # self.client：qdrant連接的位址以及port
-    # self.model：使用的模型種類
-    def __init__(self, collection_name="my_documents2-17v1"):
-        self.client = QdrantClient("localhost", port=32768)
+    # self.model：使用的模型種類（backend 由 encoders.load_encoder 依環境變數決定）
+    # self.embeddings：包在模型外的向量快取，重複的問題不必重新 encode
+    # local_collections：要載入成本地索引的小型 collection（超過 local_max_points 筆會自動改回 Qdrant 查詢）
+    # client / model / embeddings：可傳入已建立的連線、模型與向量快取，未傳入時自行建立
+    # search_workers：查詢 Qdrant 的執行緒數（LINE worker、Gradio 等同時查詢的請求共用）
+    def __init__(self, collection_name=DOCUMENTS_ALIAS, local_collections=(FAQ_COLLECTION,),
+                 local_max_points=5000, local_refresh_interval=60.0, client=None, model=None, embeddings=None,
+                 search_workers=QDRANT_SEARCH_WORKERS):
+        self.client = client or get_client()
         self.collection_name = collection_name
-        self.model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
+        # 第一次改用 alias 時，先讓 alias 指向原本的 collection
+        for alias in (collection_name, *local_collections):
+            try:
+                bootstrap_alias(self.client, alias)
+            except Exception as e:
+                print(f"❗ 無法確認 alias {alias}：{e}")
+        self.model = model or load_encoder()
+        self.embeddings = embeddings or EmbeddingStore(self.model, self.model.name, memory_size=10000)
+        self.local_indexes = {}
+        for name in local_collections:
+            index = LocalCollectionIndex(self.client, name, max_points=local_max_points,
+                                         refresh_interval=local_refresh_interval)
+            index.refresh()
+            self.local_indexes[name] = index
+        # 查詢 Qdrant 用的執行緒池（所有請求共用，大小依同時處理的請求數設定）
+        self._executor = ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix="qdrant-search")
+
+    # 把文字轉成向量
+    def encode(self, text: str):
+        with metrics.timer("rag_stage_seconds", stage="encode"):
+            return self.embeddings.encode(text).tolist()
+
+    # 對單一 collection 做向量搜尋（有可用的本地索引就不經過網路）
+    # 結果包含各筆資料的向量，組合參考內容時用來判斷重複
+    # 本地索引不可用時也會定期在背景重試載入（啟動時 Qdrant 尚未就緒、alias 尚未建立等）
+    # 查詢 Qdrant 失敗時回傳空的結果，不讓整個請求失敗
+    def _query(self, collection_name: str, vector, limit: int):
+        index = self.local_indexes.get(collection_name)
+        if index is not None:
+            index.maybe_refresh()
+        if index is not None and index.ready:
+            with metrics.timer("rag_search_seconds", collection=collection_name, mode="local"):
+                return index.search(vector, limit)
+        try:
+            with metrics.timer("rag_search_seconds", collection=collection_name, mode="remote"):
+                # 新版 qdrant_client 以 query_points 取代 search（本地 / 記憶體模式也只支援新介面）
+                if hasattr(self.client, "query_points"):
+                    return self.client.query_points(
+                        collection_name=collection_name,
+                        query=vector,
+                        limit=limit,
+                        with_vectors=True,
+                        search_params=search_params(profile_for(collection_name))
+                    ).points
+                return self.client.search(
+                    collection_name=collection_name,
+                    query_vector=vector,
+                    limit=limit,
+                    with_vectors=True,
+                    search_params=search_params(profile_for(collection_name))
+                )
+        except Exception as e:
+            # Qdrant 暫時無法使用：這個 collection 視為沒有結果，其他來源（例如本地索引的 FAQ）仍可回答
+            metrics.inc("rag_search_errors_total", collection=collection_name)
+            print(f"❗ 查詢 {collection_name} 失敗，視為沒有結果：{e}")
+            return []
+
+    # 此 collection 目前是否由本地索引回答
+    def _is_local(self, collection_name: str) -> bool:
+        index = self.local_indexes.get(collection_name)
+        return index is not None and index.ready
+
+    # 單一檢索入口：問題只 encode 一次，再同時查 FAQ、原始段落、ChatLog 三個 collection
+    # 本地索引直接在目前的執行緒查詢；需要查 Qdrant 的最後一個也在目前的執行緒查詢，其餘交給執行緒池
+    def retrieve(self, query: str, faq_limit: int = 1, doc_limit: int = 3, chatlog_limit: int = 1) -> RetrievalResult:
+        vector = self.encode(query)
+        jobs = [(FAQ_COLLECTION, faq_limit), (self.collection_name, doc_limit), (CHATLOG_COLLECTION, chatlog_limit)]
+        results = [None] * len(jobs)
+        remote = []
+        for i, (name, limit) in enumerate(jobs):
+            if self._is_local(name):
+                results[i] = self._query(name, vector, limit)
+            else:
+                remote.append(i)
+        futures = {i: self._executor.submit(self._query, jobs[i][0], vector, jobs[i][1]) for i in remote[:-1]}
+        if remote:
+            last = remote[-1]
+            results[last] = self._query(jobs[last][0], vector, jobs[last][1])
+        for i, future in futures.items():
+            results[i] = future.result()
+        faq_results, doc_results, chatlog_results = results
+
+        result = RetrievalResult(vector=vector)
+        if faq_results:
+            best = faq_results[0]
+            result.faq = SearchHit(best.payload.get("answer"), best.score, best.payload, best.vector)
+        result.paragraphs = [
+            SearchHit(r.payload.get("chunk_text", ""), r.score, r.payload, r.vector) for r in doc_results
+        ]
+        if chatlog_results:
+            best = chatlog_results[0]
+            result.chatlog = SearchHit(best.payload.get("ai_answer"), best.score, best.payload, best.vector)
+        return result
 
     # 先查詢典型字典    
     def search_faq(self, user_question: str, limit: int = 1):
-        vector = self.model.encode(user_question).tolist()
-
-        results = self.client.search(
-            collection_name="QAdic_HV3",
-            query_vector=vector,
-            limit=limit
-        )
-        print("⚡ FAQ 搜尋結果（raw）:", results)
+        vector = self.encode(user_question)
+
+        results = self._query(FAQ_COLLECTION, vector, limit)
         if not results:
-            print("❗ FAQ 沒有任何結果，可能 collection 為空")
+            trace("FAQ 沒有任何結果，可能 collection 為空")
             return None
         best = results[0]
-        print("⚡ FAQ payload:", best.payload)
-        print("⚡ FAQ score:", best.score)
-        if best.score < 0.60:
-            print("❗ score 太低 → 視為不相關")
+        trace("FAQ score=%.4f payload=%s", best.score, best.payload)
+        if best.score < SCORE_THRESHOLD:
             return None
         answer = best.payload.get("answer")
-        print("⚡ FAQ answer 欄位:", answer)
 
         return answer
     
     # 再查詢chat_log   
     def search_chatlog(self, user_question: str, limit: int = 1):
-        vector = self.model.encode(user_question).tolist()
-
-        results = self.client.search(
-            collection_name="chat_history_v2",
-            query_vector=vector,
-            limit=limit
-        )
-        print("✒️ ChatLog 搜尋結果（raw）:", results)
+        vector = self.encode(user_question)
+
+        results = self._query(CHATLOG_COLLECTION, vector, limit)
         if not results:
-            print("❗ ChatLog 沒有任何結果，可能 collection 為空")
+            trace("ChatLog 沒有任何結果，可能 collection 為空")
             return None
         best = results[0]
-        print("✒️ ChatLog payload:", best.payload)
-        print("✒️ ChatLog score:", best.score)
-        if best.score < 0.60:
-            print("❗ score 太低 → 視為不相關")
+        trace("ChatLog score=%.4f payload=%s", best.score, best.payload)
+        if best.score < SCORE_THRESHOLD:
             return None
         answer = best.payload.get("ai_answer")
-        print("✒️ ChatLog answer 欄位:", answer)
 
         return answer
 
     # 從原文章搜尋相關資料
     # 定義一個搜尋方法，輸入一個問題（query），回傳語意上最相關的幾段資料
     def search(self, query: str, limit: int = 3):
-        vector = self.model.encode(query).tolist() # 把使用者的問題轉成向量格式
-        # 向 Qdrant 發送搜尋請求
-        results = self.client.search( 
-            collection_name=self.collection_name, # 指定要在哪個 collection 裡搜尋
-            query_vector=vector,  # 使用轉換後的向量作為搜尋關鍵
-            limit=limit # 最多回傳幾筆結果（預設是 3 筆）
-        )
+        vector = self.encode(query) # 把使用者的問題轉成向量格式
+        # 向 Qdrant 發送搜尋請求（指定 collection、使用轉換後的向量、最多回傳 limit 筆）
+        results = self._query(self.collection_name, vector, limit)
         # 從搜尋結果中取出 payload（原始段落文字），組成清單回傳
         return [r.payload.get("chunk_text", "") for r in results]
 
-# 呼叫 LM Studio 模型並取得模型回答
-def ask_lmstudio(context: str, question: str) -> str:
-    # url：LM Studio 的 API 端點（預設是本地的 OpenAI 接口）
-    url = "http://127.0.0.1:1234/v1/chat/completions"
-    # 設定要送給模型的資料（payload）
-    payload = {
-        "model": "breeze-7b-instruct-v1_0", # 使用的模型種類
-        # 模仿 OpenAI 的 Chat API 格式
-        "messages": [
-            ##{"role": "system", "content": "你是繁體中文知識助手，請根據參考內容並自行補充合理內容來回答使用者問題。"},# 系統提示：設定 AI 的角色與語言
-            ##{"role": "user", "content": f"以下是參考內容：\n{context}\n\n問題：{question}"} # 使用者輸入的上下文與問題
-            {"role": "system", "content": "你是繁體中文知識助手，請根據參考內容簡短回答問題(不超出60字)，在回答時必須完全依照參考內容，請不要擅加資訊，也請不要回答任何與醫療不相關的問題"},
-            {"role": "user", "content": f"以下是根據資料庫查詢到的參考答案：\n{context}\n\n請根據此參考內容與你的理解來回答使用者的問題：{question}，但若是使用者的問題與醫療毫無相關請統一回復：抱歉！您的提問與預立醫療並無相關，若還有其他問題歡迎提問~，並且不要再加上更多回復"}
-        ],
-        "temperature": 0.7,# 控制回答的創造力（0 越穩定，1 越有創意）
-        "stream": False  # 是否開啟串流回答（這裡關閉，直接回傳整段）
-    }
-    try:
-        response = requests.post(url, json=payload, timeout=600) # 將資料（payload）透過 HTTP POST 傳給 LM Studio 的 API
-        response.raise_for_status() # 如果發生 HTTP 錯誤（例如 404、500）會丟出例外
-        result = response.json() # 解析回傳的 JSON 結果
-        return result["choices"][0]["message"]["content"].strip() # 從 JSON 裡取出模型的回答內容並移除多餘空白
-    
-    # 如果發生錯誤（如連不到模型或資料格式錯誤），回傳錯誤訊息
-    except Exception as e:
-        return f"❌ 發生錯誤：{e}"
-
 # 整合搜尋與回答 
-searcher = QdrantSearcher()
-
-#儲存使用者問題&答案的CSV
-def save_chat_log_csv(user_question: str, ai_answer: str, filename="CSV_chatlog/chat_log2.csv"):
-    # 自動偵測資料夾不存在 → 新增資料夾
-    folder = os.path.dirname(filename)
-    if folder and not os.path.exists(folder):
-        os.makedirs(folder)
-
-    file_exists = os.path.isfile(filename)
-
-    with open(filename, "a", newline="", encoding="utf-8-sig") as csvfile:
-        writer = csv.writer(csvfile)
-
-        # 如果檔案不存在 → 寫入欄位名稱
-        if not file_exists:
-            writer.writerow(["timestamp", "user_question", "ai_answer"])
-
-        writer.writerow([
-            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            user_question,
-            ai_answer
-        ])
-
-#儲存CSV後直接匯入chat_history_v1
-def insert_chat_to_qdrant(user_question, ai_answer, timestamp):
-    qdrant = QdrantClient("localhost", port=32768)
-    model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
-    COLLECTION_NAME = "chat_history_v2"
-    DIMENSION = 384
-
-    # 若 collection 不存在就先建立
-    existing_collections = [c.name for c in qdrant.get_collections().collections]
-    if COLLECTION_NAME not in existing_collections:
-        qdrant.create_collection(
-            collection_name=COLLECTION_NAME,
-            vectors_config=VectorParams(size=DIMENSION, distance=Distance.COSINE)
-        )
-        print(f"✅ Collection '{COLLECTION_NAME}' 已建立。")
-
-    # 產生向量
-    vector = model.encode(user_question).tolist()
-    # 自動取得新的 point_id（使用 Qdrant 自動遞增）
-    point_id = qdrant.count(collection_name=COLLECTION_NAME).count
-
-    point = PointStruct(
-        id=point_id,
-        vector=vector,
-        payload={
-            "timestamp": timestamp,
-            "user_question": user_question,
-            "ai_answer": ai_answer
-        }
-    )
-
-    qdrant.upsert(collection_name=COLLECTION_NAME, points=[point])
-    print(f"📌 已寫入 Qdrant：{point_id} / {user_question[:20]}...{ai_answer[:20]}...")
-
-# 定義主要的對話函式 chat，輸入問題 query，回傳模型的回答
-def chat(query):
-    faq_answer = searcher.search_faq(query)  # 查詢典型問答字典
-    related_paragraphs = searcher.search(query)  # 查詢原始段落
-    chatlog_answer = searcher.search_chatlog(query) #查chatlog
-    print("📌 搜尋到的 FAQ：", faq_answer) 
-    print("📌 搜尋到的原始段落：", related_paragraphs)
-    print("📌 搜尋到的 ChatLog：", chatlog_answer)
-    ##results = searcher.search(query) # 先用 Qdrant 向量資料庫搜尋相關段落
+# 模型與連線都是第一次用到時才建立（或由 warmup() 在背景預先建立），import 本檔不會卡住
+_qdrant_client = None
+_searcher = None
+_chat_ingestor = None
+_chatlog_maintainer = None
+_chatlog_store = None
+_client_lock = threading.Lock()
+_init_lock = threading.Lock()
+
+# Qdrant 連線（建立很快，不需要等模型載入）
+def get_qdrant_client():
+    global _qdrant_client
+    if _qdrant_client is None:
+        with _client_lock:
+            if _qdrant_client is None:
+                _qdrant_client = get_client()
+    return _qdrant_client
+
+# 向量搜尋器（載入 encoder、本地 FAQ 索引）
+def get_searcher():
+    global _searcher
+    if _searcher is None:
+        client = get_qdrant_client()
+        with _init_lock:
+            if _searcher is None:
+                _searcher = QdrantSearcher(client=client)
+    return _searcher
+
+# 所有 LLM 生成都經過排程器：限制同時生成數、排隊有上限與等待期限，相同的請求共用一次生成
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "2"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "16"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+llm_scheduler = LLMScheduler(stream_lmstudio, max_concurrency=LLM_MAX_CONCURRENCY, max_queue=LLM_MAX_QUEUE,
+                             queue_timeout=LLM_QUEUE_TIMEOUT).start()
+
+# 參考內容的組合方式（token 上限、重複門檻、tokenizer 由環境變數 CONTEXT_* 設定）
+# FAQ / ChatLog 答案的向量經過搜尋器的向量快取計算
+context_builder = ContextBuilder(encode=lambda texts: get_searcher().embeddings.encode(texts))
+
+# 回答快取（精確比對 LRU + TTL，以及 FAQ / ChatLog 高相似度直接回答）
+answer_cache = AnswerCache(max_size=1024, ttl=3600, semantic_threshold=0.92)
+
+# 問答紀錄（SQLite，背景執行緒批次寫入；需要 CSV 時以 chatlog_store.py export 匯出）
+def get_chatlog_store():
+    global _chatlog_store
+    if _chatlog_store is None:
+        with _init_lock:
+            if _chatlog_store is None:
+                _chatlog_store = ChatLogStore(CHATLOG_DB_PATH).start()
+                atexit.register(_chatlog_store.close)  # 程式結束前把佇列中剩下的紀錄寫完
+    return _chatlog_store
+
+#儲存使用者問題&答案（只放進佇列，不等待寫入）
+def save_chat_log(user_question: str, ai_answer: str, timestamp: str = None):
+    get_chatlog_store().append(user_question, ai_answer, timestamp)
+
+# 背景寫入 chat_history_v2（沿用 searcher 的向量快取與連線），同時啟動定期維護
+def get_chat_ingestor():
+    global _chat_ingestor, _chatlog_maintainer
+    if _chat_ingestor is None:
+        searcher = get_searcher()
+        with _init_lock:
+            if _chat_ingestor is None:
+                _chat_ingestor = ChatLogIngestor(searcher.client, searcher.embeddings, CHATLOG_COLLECTION,
+                                                 duplicate_threshold=CHATLOG_DUPLICATE_THRESHOLD).start()
+                atexit.register(_chat_ingestor.close)  # 程式結束前把佇列中剩下的資料寫完
+                _chatlog_maintainer = ChatLogMaintainer(
+                    searcher.client, CHATLOG_COLLECTION, interval=CHATLOG_MAINTENANCE_INTERVAL,
+                    max_age_days=CHATLOG_MAX_AGE_DAYS, max_points=CHATLOG_MAX_POINTS,
+                    threshold=CHATLOG_DUPLICATE_THRESHOLD
+                ).start()
+    return _chat_ingestor
+
+#記錄問答後直接匯入chat_history
+# 只放進背景佇列，不等待 Qdrant 寫入完成；vector 可直接沿用檢索時算好的向量
+def insert_chat_to_qdrant(user_question, ai_answer, timestamp, vector=None):
+    get_chat_ingestor().submit(user_question, ai_answer, timestamp, vector=vector)
+
+NOT_FOUND_MESSAGE = "❌ 找不到相關內容。請換個說法。"
+
+# 檢索並組合參考內容，找不到任何內容時 combined_context 為 None
+def build_context(query):
+    with metrics.timer("rag_stage_seconds", stage="retrieve"):
+        retrieval = get_searcher().retrieve(query)  # 一次查詢典型問答字典、原始段落、chatlog
+    started = time.perf_counter()
+    faq_answer = retrieval.faq_answer
+    related_paragraphs = retrieval.paragraph_texts
+    chatlog_answer = retrieval.chatlog_answer
+    metrics.inc("rag_threshold_total", source="faq", result="hit" if faq_answer else "miss")
+    metrics.inc("rag_threshold_total", source="chatlog", result="hit" if chatlog_answer else "miss")
+    trace("檢索結果 faq=%s paragraphs=%s chatlog=%s", retrieval.faq, retrieval.paragraphs, retrieval.chatlog)
+    ##results = get_searcher().search(query) # 先用 Qdrant 向量資料庫搜尋相關段落
     ##if not results:
     if not faq_answer and not related_paragraphs and not chatlog_answer:
-        return "❌ 找不到相關內容。請換個說法。" # 如果沒找到內容就回傳提示
-    # 組合參考內容
-    combined_context = ""
-    if faq_answer:
-        combined_context += f"【典型問答】\n{faq_answer}\n\n"
-    if related_paragraphs:
-        combined_context += "【相關段落】\n" + "\n---\n".join(related_paragraphs)
-    if chatlog_answer:
-        combined_context += f"【典型問答】\n{chatlog_answer}\n\n"
+        return retrieval, None
+    # 組合參考內容（去除三個來源間重複的內容，依分數挑選到 token 上限為止）
+    combined_context = context_builder.build(retrieval.passages())
+    trace("參考內容 %d 字", len(combined_context or ""))
     ##context = "\n\n".join(results)  # 將多個段落用換行分隔組成上下文
-    answer = ask_lmstudio(combined_context, query)  # 把上下文與問題一起送去給 LM Studio 生成回答
-
-    save_chat_log_csv(query, answer)      # ★ 在這裡記錄進 chat_log.csv
-
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    insert_chat_to_qdrant(query, answer, timestamp) #將新增的csv內容也新增近qdrant
-
+    metrics.observe("rag_stage_seconds", time.perf_counter() - started, stage="context")
+    return retrieval, combined_context
+
+# 記錄問答：寫入問答紀錄與 chat_history
+# 錯誤訊息只留在問答紀錄，不寫入 chat_history（否則下次相同問題會被語意比對直接回覆錯誤訊息）
+def record_answer(query, answer, retrieval):
+    timestamp = datetime.now().strftime(TIMESTAMP_FORMAT)
+    save_chat_log(query, answer, timestamp)      # ★ 在這裡記錄進問答紀錄
+    if not is_error_answer(answer):
+        insert_chat_to_qdrant(query, answer, timestamp, retrieval.vector) #將新增的csv內容也新增近qdrant
+
+# 串流版的對話函式：每收到新的 token 就 yield 目前累積的回答（給 Gradio 即時顯示）
+# 串流結束後組出完整回答再寫入紀錄
+# 重複或與 FAQ / ChatLog 幾乎相同的問題會直接由 answer_cache 回答，不呼叫 LLM
+def chat_stream(query):
+    cached_answer = answer_cache.get(query)
+    if cached_answer is not None:
+        metrics.inc("rag_requests_total", result="exact_cache")
+        save_chat_log(query, cached_answer)
+        yield cached_answer
+        return
+
+    retrieval, combined_context = build_context(query)
+    semantic = answer_cache.semantic_lookup(retrieval.faq, retrieval.chatlog)
+    if semantic is not None:
+        answer, source = semantic
+        metrics.inc("rag_requests_total", result=f"{source}_cache")
+        trace("直接使用 %s 的答案（略過 LLM）", source)
+        answer_cache.put(query, answer)
+        save_chat_log(query, answer)
+        yield answer
+        return
+
+    if combined_context is None:
+        metrics.inc("rag_requests_total", result="not_found")
+        yield NOT_FOUND_MESSAGE # 如果沒找到內容就回傳提示
+        return
+
+    answer = ""
+    started = time.perf_counter()
+    try:
+        # 把上下文與問題一起交給排程器，由 LM Studio 生成回答
+        for piece in llm_scheduler.stream(combined_context, query):
+            if not answer:
+                metrics.observe("rag_llm_seconds", time.perf_counter() - started, phase="first_token")
+            answer += piece
+            yield answer
+    except SchedulerBusy as e:
+        # 忙碌中：立刻回覆，不寫入紀錄也不放進快取
+        metrics.inc("rag_requests_total", result="busy")
+        trace("LLM 忙碌中：%s", e)
+        yield BUSY_MESSAGE
+        return
+    except GenerationFailed as e:
+        # 生成中斷：顯示已產生的內容與錯誤訊息，只寫入問答紀錄，不寫入 chat_history 也不放進快取
+        metrics.inc("rag_requests_total", result="error")
+        trace("LLM 生成失敗：%s", e)
+        answer = (e.partial.strip() + "\n\n" if e.partial.strip() else "") + f"❌ 發生錯誤：{e}"
+        save_chat_log(query, answer)
+        yield answer
+        return
+    metrics.observe("rag_llm_seconds", time.perf_counter() - started, phase="total")
+    answer = answer.strip()
+    metrics.inc("rag_requests_total", result="error" if is_error_answer(answer) else "generated")
+
+    record_answer(query, answer, retrieval)
+    answer_cache.put(query, answer)  # 錯誤訊息不會放進快取
+    yield answer
+
+# 定義主要的對話函式 chat，輸入問題 query，回傳模型的完整回答（LINE 使用）
+def chat(query):
+    answer = NOT_FOUND_MESSAGE
+    for answer in chat_stream(query):
+        pass
     return answer
 
-# 建立 Gradio UI 
-iface = gr.Interface(
-    fn=chat,  # 指定主函式 chat 當作輸入輸出的處理函數
-    inputs=gr.Textbox(lines=2, placeholder="請輸入你的問題..."), # 建立一個輸入框，讓使用者輸入問題
-    outputs=gr.Textbox(label="AI 回答"), # 建立一個輸出框顯示 AI 的回答
-    title="📚 文件問答助理 (Qdrant + LM Studio)",  # 網頁的標題
-    description="輸入問題，系統會先從 Qdrant 向量資料庫中搜尋相關段落，再請本地模型回答。" # 介面的簡短說明
-)
+# 建立 Gradio UI（gradio 載入較久，只在真的要啟動介面時才 import）
+def build_interface():
+    import gradio as gr
+
+    return gr.Interface(
+        fn=chat_stream,  # 指定串流版的 chat 當作輸入輸出的處理函數（逐字顯示回答）
+        inputs=gr.Textbox(lines=2, placeholder="請輸入你的問題..."), # 建立一個輸入框，讓使用者輸入問題
+        outputs=gr.Textbox(label="AI 回答"), # 建立一個輸出框顯示 AI 的回答
+        title="📚 文件問答助理 (Qdrant + LM Studio)",  # 網頁的標題
+        description="輸入問題，系統會先從 Qdrant 向量資料庫中搜尋相關段落，再請本地模型回答。" # 介面的簡短說明
+    )
 
 ## 啟動 Gradio 介面，開啟本地瀏覽器讓使用者互動
-##iface.launch()
+##build_interface().launch()
+
+# ============= 啟動檢查（warmup）與健康狀態 =============
+# encoder：載入模型並做一次 encode；qdrant：確認可連線；lmstudio：確認模型可使用
+READY_COMPONENTS = ("encoder", "qdrant", "lmstudio")
+READINESS_MAX_AGE = 10  # /readyz 重新檢查遠端元件的間隔（秒）
+
+def _check_encoder():
+    searcher = get_searcher()
+    searcher.encode("暖機")
+    get_chat_ingestor()
+    return searcher.model.name
+
+def _check_qdrant():
+    collections = get_qdrant_client().get_collections().collections
+    return f"{len(collections)} 個 collection"
+
+health = HealthRegistry(READY_COMPONENTS)
+health.register("encoder", _check_encoder)
+health.register("qdrant", _check_qdrant)
+health.register("lmstudio", probe_lmstudio)
+
+# 各元件的狀態也輸出到 /metrics
+metrics.add_gauge("rag_answer_cache", "回答快取狀態", lambda: answer_cache.stats())
+metrics.add_gauge("rag_line_dispatcher", "LINE 背景處理池狀態", lambda: line_dispatcher.stats())
+metrics.add_gauge("rag_llm_scheduler", "LLM 排程器狀態", lambda: llm_scheduler.stats())
+metrics.add_gauge("rag_embedding_cache", "向量快取狀態", lambda: _searcher.embeddings.stats() if _searcher else None)
+metrics.add_gauge("rag_component_ready", "各元件是否正常（1 / 0）",
+                  lambda: {name: int(state["status"] == "ok") for name, state in health.snapshot().items()})
+
+# 同時檢查所有元件（模型載入與網路檢查平行進行）
+def warmup():
+    with ThreadPoolExecutor(max_workers=len(READY_COMPONENTS), thread_name_prefix="warmup") as executor:
+        results = dict(zip(READY_COMPONENTS, executor.map(health.run, READY_COMPONENTS)))
+    for name, state in health.snapshot().items():
+        mark = "✅" if state["status"] == "ok" else "❌"
+        print(f"{mark} warmup {name}：{state['detail']}（{state['latency_ms']} ms）")
+    return all(results.values())
+
+# 存活檢查：程序有在執行就回 200
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    return jsonify({"status": "ok"})
+
+# encoder 檢查失敗後在背景重新檢查（載入模型可能很久，不阻塞 /readyz；同一時間只執行一次）
+_encoder_recheck_lock = threading.Lock()
+
+def _recheck_encoder():
+    if not _encoder_recheck_lock.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            health.refresh(("encoder",), READINESS_MAX_AGE)
+        finally:
+            _encoder_recheck_lock.release()
+
+    threading.Thread(target=run, name="encoder-recheck", daemon=True).start()
+
+# 就緒檢查：所有元件都正常才回 200，否則回 503，並附上各元件狀態
+# （encoder 由 warmup 檢查，失敗時每 READINESS_MAX_AGE 秒在背景重試；Qdrant 與 LM Studio 超過 READINESS_MAX_AGE 秒會重新檢查）
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    if health.snapshot()["encoder"]["status"] == "error":
+        _recheck_encoder()
+    if health.ready(("encoder",)):
+        health.refresh(("qdrant", "lmstudio"), READINESS_MAX_AGE)
+    ready = health.ready(READY_COMPONENTS)
+    return jsonify({"ready": ready, "components": health.snapshot()}), (200 if ready else 503)
 
 # ============= 同時啟動 Flask + Gradio =============
 if __name__ == "__main__":
     def run_gradio():
-        iface.launch(server_port=7860, share=True)  # Gradio 在 7860 port
+        build_interface().launch(server_port=7860, share=True)  # Gradio 在 7860 port
+
+    # 模型載入、Qdrant / LM Studio 檢查在背景進行，Flask 可以先回應 /healthz 與 /readyz
+    threading.Thread(target=warmup, name="warmup", daemon=True).start()
 
     t = threading.Thread(target=run_gradio)
     t.start()
 
-    app.run(host="0.0.0.0", port=5000)  # Flask 在 5000 port
\ No newline at end of file
+    app.run(host="0.0.0.0", port=5000)  # Flask 在 5000 port
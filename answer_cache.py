@@ -0,0 +1,92 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# 問句結尾常見、不影響語意的標點
+_TRAILING_PUNCTUATION = "?？!！。.~～ "
+# 錯誤訊息（LM Studio 連線失敗、找不到內容等）的開頭，這類回答不快取也不寫入 chat_history
+ERROR_PREFIX = "❌"
+
+
+# 是否為錯誤訊息而不是真正的回答
+def is_error_answer(answer: str) -> bool:
+    return (answer or "").lstrip().startswith(ERROR_PREFIX)
+
+
+# 正規化問題文字：全形轉半形、去除多餘空白與結尾標點、英文轉小寫
+def normalize_question(question: str) -> str:
+    text = unicodedata.normalize("NFKC", question or "")
+    text = re.sub(r"\s+", " ", text).strip().lower()
+    return text.rstrip(_TRAILING_PUNCTUATION)
+
+
+# 回答快取：在呼叫 LLM 之前先檢查
+# 1. 精確比對：正規化後相同的問題，TTL 內直接回傳上次的回答（LRU 淘汰）
+# 2. 語意比對：FAQ 或 ChatLog 的相似度高於 semantic_threshold 時，直接使用資料庫中的答案
+class AnswerCache:
+    # max_size：精確比對最多保留幾筆
+    # ttl：精確比對的有效秒數
+    # semantic_threshold：語意比對視為「同一個問題」的相似度門檻
+    def __init__(self, max_size=1024, ttl=3600, semantic_threshold=0.92):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self._entries = OrderedDict()  # key -> (answer, expires_at)
+        self._lock = threading.Lock()
+        self._counters = {"exact_hits": 0, "exact_misses": 0, "expired": 0,
+                          "faq_hits": 0, "chatlog_hits": 0, "semantic_misses": 0}
+
+    # 精確比對，沒有或已過期回傳 None
+    def get(self, question: str):
+        key = normalize_question(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["exact_misses"] += 1
+                return None
+            answer, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._counters["expired"] += 1
+                self._counters["exact_misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["exact_hits"] += 1
+            return answer
+
+    # 存入一筆回答，超過上限時淘汰最久沒用到的（錯誤訊息不存）
+    def put(self, question: str, answer: str):
+        key = normalize_question(question)
+        if not key or not answer or is_error_answer(answer):
+            return
+        with self._lock:
+            self._entries[key] = (answer, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    # 語意比對：faq_hit / chatlog_hit 為 SearchHit（可為 None），依 FAQ → ChatLog 的順序判斷
+    # 命中回傳 (答案, 來源)，否則回傳 None；資料庫中的答案若是錯誤訊息則不採用
+    def semantic_lookup(self, faq_hit, chatlog_hit):
+        for source, hit in (("faq", faq_hit), ("chatlog", chatlog_hit)):
+            if hit is None or not hit.text or is_error_answer(hit.text):
+                continue
+            if hit.score >= self.semantic_threshold:
+                with self._lock:
+                    self._counters[f"{source}_hits"] += 1
+                return hit.text, source
+        with self._lock:
+            self._counters["semantic_misses"] += 1
+        return None
+
+    # 快取狀態與命中次數
+    def stats(self) -> dict:
+        with self._lock:
+            result = dict(self._counters)
+            result["size"] = len(self._entries)
+        result["max_size"] = self.max_size
+        result["ttl"] = self.ttl
+        result["semantic_threshold"] = self.semantic_threshold
+        return result
@@ -0,0 +1,293 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from qdrant_client import QdrantClient
+
+import lmstudio_client
+import metrics
+from answer_cache import AnswerCache
+from embedding_cache import EmbeddingStore
+from encoders import load_encoder
+from fake_lmstudio import FakeLMStudioServer
+from qdrant_ingest import SOURCES, ingest_source, rebuild_source
+
+# chat() 的離線壓測工具（不需要 Qdrant 伺服器與 LM Studio）
+# 1. 以 qdrant_client 的記憶體模式建立 collection，並用 repo 內的 CSV_v3 / CSV_QAHv1 / CSV_chatlog 匯入資料（同時量測匯入速度）
+# 2. 啟動 fake_lmstudio.py 的假模型（可設定第一個 token 與每個 token 的延遲）
+# 3. 以指定的並行數重複送出問題，統計端到端延遲、第一個字出現的時間、各階段耗時的 p50 / p95 / p99、吞吐量與記憶體
+# 4. 結果寫成 JSON，可用 --compare 與先前的結果比較
+# 用法：
+#   python bench_chat.py --concurrency 1 4 8 --requests 200 --token-ms 20 --output bench_results.json
+#   python bench_chat.py --compare bench_results_old.json
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(BASE_DIR, "bench_results.json")
+
+
+# 記憶體模式的 QdrantClient 不是 thread-safe（背景寫入 chat_history 與搜尋同時進行會出錯），
+# 壓測時以一把鎖讓所有呼叫依序執行
+class SerializedClient:
+    def __init__(self, client):
+        self._client = client
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            with self._lock:
+                return attr(*args, **kwargs)
+        return call
+
+
+# 延遲統計（毫秒）
+def summarize(values) -> dict:
+    if not values:
+        return {"count": 0}
+    array = np.asarray(values, dtype=np.float64) * 1000
+    return {
+        "count": int(array.size),
+        "mean_ms": round(float(array.mean()), 3),
+        "p50_ms": round(float(np.percentile(array, 50)), 3),
+        "p95_ms": round(float(np.percentile(array, 95)), 3),
+        "p99_ms": round(float(np.percentile(array, 99)), 3),
+        "max_ms": round(float(array.max()), 3),
+    }
+
+
+# 程式執行期間的最高記憶體用量（MB），無法取得時回傳 None
+def peak_rss_mb():
+    try:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 的單位是 KB，macOS 是 bytes
+        return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+
+        return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+    except Exception:
+        return None
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BASE_DIR, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+# 測試問題：指定檔案（每行一題），否則使用 FAQ 與對話紀錄中的問題
+def load_questions(path: str = None):
+    if path:
+        with open(path, encoding="utf-8-sig") as f:
+            return [line.strip() for line in f if line.strip()]
+    questions = []
+    faq = pd.read_csv(os.path.join(BASE_DIR, "CSV_QAHv1", "QA_HV1.csv"), encoding="utf-8-sig")
+    questions.extend(faq["question"].dropna().astype(str).tolist())
+    chatlog_folder = os.path.join(BASE_DIR, "CSV_chatlog")
+    for filename in sorted(os.listdir(chatlog_folder)):
+        if filename.endswith(".csv"):
+            df = pd.read_csv(os.path.join(chatlog_folder, filename), encoding="utf-8-sig")
+            questions.extend(df["user_question"].dropna().astype(str).tolist())
+    return [q.strip() for q in questions if q.strip()]
+
+
+# 把 repo 內的 CSV 匯入記憶體模式的 Qdrant，回傳各來源的匯入速度
+# 有 alias 的來源與正式環境相同，建立新版本並驗證後切換 alias（匯入時間包含驗證）
+def seed_collections(client, encoder, chatlog_collection: str, batch_size: int) -> dict:
+    results = {}
+    for source, collection_name in (("documents", None), ("faq", None), ("chatlog", chatlog_collection)):
+        started = time.perf_counter()
+        if SOURCES[source].get("alias"):
+            stats = rebuild_source(source, client=client, model=encoder, batch_size=batch_size)
+        else:
+            stats = ingest_source(source, collection_name=collection_name, client=client, model=encoder,
+                                  batch_size=batch_size)
+        elapsed = time.perf_counter() - started
+        results[source] = {
+            "rows": stats["rows"],
+            "uploaded": stats["uploaded"],
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(stats["rows"] / elapsed, 1) if elapsed > 0 else None,
+        }
+    return results
+
+
+# 送出一個問題，回傳 (第一個字出現的秒數, 完成的秒數)
+def run_request(rag, question: str):
+    started = time.perf_counter()
+    first = None
+    for _ in rag.chat_stream(question):
+        if first is None:
+            first = time.perf_counter() - started
+    return first, time.perf_counter() - started
+
+
+# 以 concurrency 個執行緒送出 requests 個問題
+def run_level(rag, questions, concurrency: int, requests: int, warmup: int, samples: dict) -> dict:
+    for i in range(warmup):
+        run_request(rag, questions[i % len(questions)])
+    samples.clear()
+
+    ttfts, totals, errors = [], [], 0
+    lock = threading.Lock()
+
+    def task(i):
+        nonlocal errors
+        try:
+            first, total = run_request(rag, questions[i % len(questions)])
+            with lock:
+                ttfts.append(first)
+                totals.append(total)
+        except Exception as e:
+            with lock:
+                errors += 1
+            print(f"❌ 請求失敗：{e}")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(task, range(requests)))
+    wall = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(totals) / wall, 3) if wall > 0 else None,
+        "end_to_end": summarize(totals),
+        "time_to_first_output": summarize([t for t in ttfts if t is not None]),
+        "stages": {key: summarize(values) for key, values in sorted(samples.items())},
+    }
+
+
+# 與先前的結果比較（同一並行數的 p95 與吞吐量）
+def compare(previous_path: str, current: dict):
+    with open(previous_path, encoding="utf-8") as f:
+        previous = json.load(f)
+    old_runs = {run["concurrency"]: run for run in previous.get("runs", [])}
+    print(f"\n與 {previous_path}（commit {str(previous.get('meta', {}).get('git_commit'))[:8]}）比較：")
+    for run in current["runs"]:
+        old = old_runs.get(run["concurrency"])
+        if old is None:
+            continue
+        old_p95 = old["end_to_end"].get("p95_ms")
+        new_p95 = run["end_to_end"].get("p95_ms")
+        old_rps, new_rps = old.get("throughput_rps"), run.get("throughput_rps")
+        p95_change = f"{(new_p95 / old_p95 - 1) * 100:+.1f}%" if old_p95 and new_p95 else "n/a"
+        rps_change = f"{(new_rps / old_rps - 1) * 100:+.1f}%" if old_rps and new_rps else "n/a"
+        print(f"  並行 {run['concurrency']:>3}：p95 {old_p95} → {new_p95} ms（{p95_change}），"
+              f"吞吐量 {old_rps} → {new_rps} req/s（{rps_change}）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="chat() 的離線壓測")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4], help="要測試的並行數（可多個）")
+    parser.add_argument("--requests", type=int, default=100, help="每個並行數送出的請求數")
+    parser.add_argument("--warmup", type=int, default=5, help="正式量測前先送出的請求數")
+    parser.add_argument("--questions", help="問題檔（每行一題），預設使用 FAQ 與對話紀錄中的問題")
+    parser.add_argument("--first-token-ms", type=float, default=200.0, help="假模型第一個 token 的延遲")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="假模型每個 token 的間隔")
+    parser.add_argument("--tokens", type=int, default=60, help="假模型每次回答的 token 數")
+    parser.add_argument("--backend", help="encoder backend（預設依環境變數）")
+    parser.add_argument("--model-dir", help="encoder 的本地模型資料夾")
+    parser.add_argument("--ingest-batch-size", type=int, default=256)
+    parser.add_argument("--answer-cache", action="store_true", help="啟用回答快取（預設關閉，讓每個請求都走完整流程）")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="結果 JSON 檔")
+    parser.add_argument("--compare", help="要比較的先前結果 JSON 檔")
+    args = parser.parse_args()
+
+    # 假的 LM Studio
+    fake = FakeLMStudioServer(first_token_ms=args.first_token_ms, token_ms=args.token_ms, tokens=args.tokens).start()
+    lmstudio_client.LMSTUDIO_URL = f"{fake.url}/v1/chat/completions"
+    lmstudio_client.MODELS_URL = f"{fake.url}/v1/models"
+
+    # 記憶體模式的 Qdrant 與 encoder
+    client = SerializedClient(QdrantClient(":memory:"))
+    encoder = load_encoder(args.backend, model_dir=args.model_dir)
+
+    import UI_RAG as rag
+
+    print("📥 匯入測試資料…")
+    ingestion = seed_collections(client, encoder, rag.CHATLOG_COLLECTION, args.ingest_batch_size)
+
+    rag._qdrant_client = client
+    # 向量快取只放在記憶體：encode 階段的耗時不受先前執行留在 embedding_cache/ 的資料影響，--compare 才有意義
+    embeddings = EmbeddingStore(encoder, encoder.name, memory_size=10000, persist=False)
+    rag._searcher = rag.QdrantSearcher(client=client, model=encoder, embeddings=embeddings)
+    if not args.answer_cache:
+        rag.answer_cache = AnswerCache(max_size=0, semantic_threshold=float("inf"))
+
+    # 收集各階段的原始耗時
+    samples = defaultdict(list)
+
+    def collect(name, value, labels):
+        key = name + "".join(f"[{k}={v}]" for k, v in sorted(labels.items()))
+        samples[key].append(value)
+
+    metrics.add_observer(collect)
+
+    questions = load_questions(args.questions)
+    runs = []
+    # chat() 會寫問答紀錄，在暫存資料夾中執行以免動到 repo 內的資料
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            for concurrency in args.concurrency:
+                print(f"🚀 並行 {concurrency}，{args.requests} 個請求…")
+                run = run_level(rag, questions, concurrency, args.requests, args.warmup, samples)
+                runs.append(run)
+                e2e = run["end_to_end"]
+                print(f"   吞吐量 {run['throughput_rps']} req/s，p50 {e2e.get('p50_ms')} ms，"
+                      f"p95 {e2e.get('p95_ms')} ms，p99 {e2e.get('p99_ms')} ms，錯誤 {run['errors']}")
+            rag.get_chat_ingestor().close()
+            rag.get_chatlog_store().close()
+        finally:
+            os.chdir(original_cwd)
+            metrics.remove_observer(collect)
+            fake.stop()
+
+    result = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "encoder": encoder.name,
+            "questions": len(questions),
+            "args": vars(args),
+        },
+        "ingestion": ingestion,
+        "runs": runs,
+        "memory": {"peak_rss_mb": peak_rss_mb()},
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"✅ 結果已寫入：{args.output}")
+
+    if args.compare:
+        compare(args.compare, result)
+
+
+if __name__ == "__main__":
+    main()
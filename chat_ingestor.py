@@ -0,0 +1,192 @@
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+from qdrant_client.http.models import PointStruct
+
+import metrics
+from chatlog_store import TIMESTAMP_FORMAT
+from qdrant_collections import CHATLOG_COLLECTION
+from qdrant_provision import ensure_collection
+
+# 結束背景執行緒用的記號
+_STOP = object()
+
+
+# 把 "2025-01-01 12:00:00" 轉成 Unix 秒數（payload 的 ts 欄位，供保存期限的篩選使用），格式不符時回傳 None
+def timestamp_to_ts(timestamp):
+    try:
+        return datetime.strptime(str(timestamp), TIMESTAMP_FORMAT).timestamp()
+    except ValueError:
+        return None
+
+
+# 背景寫入 chat_history 的服務
+# 問答完成後只把資料放進 queue，由背景執行緒批次 encode + upsert 到 Qdrant，
+# 不會拖慢 chat() 回傳的時間
+# 與既有問題幾乎相同（cosine >= duplicate_threshold）時不新增 point，而是以最新的問答更新該 point
+# payload：timestamp、ts（Unix 秒數）、user_question、ai_answer、hits（被問過的次數）
+class ChatLogIngestor:
+    # client / model：直接沿用 QdrantSearcher 已經建立好的連線與模型（或其向量快取）
+    # batch_size：一次 upsert 最多幾筆
+    # flush_interval：最多等待幾秒就送出目前累積的資料
+    # max_queue：queue 上限，滿了就丟棄並印出警告，避免記憶體無限成長
+    # duplicate_threshold：與既有問題的相似度達此值就更新既有 point（設為大於 1 可停用）
+    def __init__(self, client, model, collection_name=CHATLOG_COLLECTION, dimension=384,
+                 batch_size=32, flush_interval=1.0, max_queue=1000, duplicate_threshold=0.95):
+        self.client = client
+        self.model = model
+        self.collection_name = collection_name
+        self.dimension = dimension
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.duplicate_threshold = duplicate_threshold
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._collection_ready = False
+
+    # 啟動背景執行緒
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="chatlog-ingestor", daemon=True)
+            self._thread.start()
+        return self
+
+    # 加入一筆問答（vector 若已經算過就直接帶入，避免重複 encode）
+    def submit(self, user_question, ai_answer, timestamp, vector=None) -> bool:
+        item = {
+            "timestamp": timestamp,
+            "user_question": user_question,
+            "ai_answer": ai_answer,
+            "vector": vector,
+        }
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            metrics.inc("rag_chat_history_dropped_total")
+            print(f"❗ chat_history 寫入佇列已滿，略過：{user_question[:20]}...")
+            return False
+
+    # 送出剩下的資料並停止背景執行緒（程式結束時呼叫）
+    def close(self, timeout=10.0):
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    # 若 collection 不存在就依 profile 建立，並確認 ts 欄位有 payload index（保存期限以 ts 篩選）
+    def _ensure_collection(self):
+        if self._collection_ready:
+            return
+        ensure_collection(self.client, self.collection_name, dimension=self.dimension)
+        self._collection_ready = True
+
+    # 每個向量在 collection 中最相近的一筆（含 payload），collection 為空時為 None
+    def _nearest(self, vectors):
+        if hasattr(self.client, "query_batch_points"):
+            from qdrant_client.http.models import QueryRequest
+
+            responses = self.client.query_batch_points(
+                collection_name=self.collection_name,
+                requests=[QueryRequest(query=vector, limit=1, with_payload=True) for vector in vectors]
+            )
+            return [response.points[0] if response.points else None for response in responses]
+        results = []
+        for vector in vectors:
+            hits = self.client.search(collection_name=self.collection_name, query_vector=vector, limit=1)
+            results.append(hits[0] if hits else None)
+        return results
+
+    # 決定每筆問答要寫入的 point：與既有 point 或同一批中較早的問題重複時沿用同一個 id
+    def _assign_points(self, batch):
+        nearest = [None] * len(batch)
+        if self.duplicate_threshold <= 1:
+            nearest = self._nearest([item["vector"] for item in batch])
+
+        points = {}  # id -> PointStruct（同一批中後面的問答會覆蓋前面的，保留最新的回答）
+        batch_ids, batch_vectors = [], []
+        for item, hit in zip(batch, nearest):
+            vector = np.asarray(item["vector"], dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+            point_id, hits = None, 1
+
+            # 先與同一批中已處理的問題比對
+            if batch_vectors:
+                sims = np.stack(batch_vectors) @ vector
+                best = int(sims.argmax())
+                if sims[best] >= self.duplicate_threshold:
+                    point_id = batch_ids[best]
+                    hits = points[point_id].payload["hits"] + 1
+            # 再與 collection 中既有的問題比對
+            if point_id is None and hit is not None and hit.score >= self.duplicate_threshold:
+                point_id = str(hit.id)
+                hits = int((hit.payload or {}).get("hits", 1)) + 1
+            if point_id is None:
+                # 使用 uuid 當作 point id，多個請求同時寫入也不會互相覆蓋
+                point_id = str(uuid.uuid4())
+            else:
+                metrics.inc("rag_chat_history_deduplicated_total")
+
+            points[point_id] = PointStruct(
+                id=point_id,
+                vector=item["vector"],
+                payload={
+                    "timestamp": item["timestamp"],
+                    "ts": timestamp_to_ts(item["timestamp"]) or time.time(),
+                    "user_question": item["user_question"],
+                    "ai_answer": item["ai_answer"],
+                    "hits": hits
+                }
+            )
+            if point_id not in batch_ids:
+                batch_ids.append(point_id)
+                batch_vectors.append(vector)
+        return list(points.values())
+
+    # 背景執行緒：累積一批資料後一次寫入
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch.append(item)
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+    # 把一批問答轉成 PointStruct 並 upsert
+    def _flush(self, batch):
+        try:
+            self._ensure_collection()
+
+            # 沒有帶向量的問題一次批次 encode
+            missing = [item for item in batch if item["vector"] is None]
+            if missing:
+                vectors = self.model.encode([item["user_question"] for item in missing])
+                for item, vector in zip(missing, vectors):
+                    item["vector"] = vector.tolist()
+
+            points = self._assign_points(batch)
+            with metrics.timer("rag_stage_seconds", stage="chat_insert"):
+                self.client.upsert(collection_name=self.collection_name, points=points)
+            metrics.inc("rag_chat_history_inserted_total", len(points))
+        except Exception as e:
+            print(f"❌ 寫入 chat_history 發生錯誤：{e}")
@@ -0,0 +1,182 @@
+import argparse
+import threading
+import time
+
+import numpy as np
+from qdrant_client.http import models
+
+from chat_ingestor import timestamp_to_ts
+from qdrant_collections import CHATLOG_COLLECTION
+from qdrant_provision import ensure_payload_indexes, get_client
+from semantic_dedup import dedup_embeddings
+
+# chat_history 的維護：讓 collection 的大小（以及 search_chatlog 的延遲）長期維持穩定
+# - backfill：舊的 point 沒有 ts 欄位時，由 timestamp 字串補上
+# - retention：刪除超過 max_age_days 天的問答；總數超過 max_points 時再刪除最舊的
+# - compact：相似度達 threshold 的問題視為同一群，只保留最新的一筆（hits 加總），其餘刪除
+# ChatLogMaintainer 在服務中定期於背景執行以上三項；也可以手動執行：
+#   python chatlog_maintenance.py all --max-age-days 180 --max-points 20000 --threshold 0.95
+#   python chatlog_maintenance.py compact --collection chat_history_v2 --dry-run
+
+DEFAULT_COLLECTION = CHATLOG_COLLECTION
+DAY_SECONDS = 24 * 60 * 60
+
+
+# 逐頁讀出 collection 中的所有 point
+def iter_points(client, collection_name: str, with_vectors: bool = False, scroll_filter=None, page_size: int = 512):
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            scroll_filter=scroll_filter,
+            limit=page_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=with_vectors
+        )
+        yield from points
+        if offset is None:
+            return
+
+
+def _delete(client, collection_name: str, ids, batch_size: int = 256):
+    ids = list(ids)
+    for start in range(0, len(ids), batch_size):
+        client.delete(collection_name=collection_name,
+                      points_selector=models.PointIdsList(points=ids[start:start + batch_size]))
+    return len(ids)
+
+
+# 沒有 ts 的 point 由 timestamp 補上（無法解析時以目前時間計算，避免被當成最舊的資料刪掉）
+def backfill_ts(client, collection_name: str = DEFAULT_COLLECTION) -> int:
+    missing = models.Filter(must=[models.IsEmptyCondition(is_empty=models.PayloadField(key="ts"))])
+    updated = 0
+    now = time.time()
+    for point in list(iter_points(client, collection_name, scroll_filter=missing)):
+        ts = timestamp_to_ts((point.payload or {}).get("timestamp")) or now
+        client.set_payload(collection_name=collection_name, payload={"ts": ts}, points=[point.id])
+        updated += 1
+    return updated
+
+
+# 依保存期限與數量上限刪除舊問答，回傳 {"expired": n, "overflow": n}
+def apply_retention(client, collection_name: str = DEFAULT_COLLECTION, max_age_days: float = None,
+                    max_points: int = None, dry_run: bool = False) -> dict:
+    result = {"expired": 0, "overflow": 0}
+    if max_age_days:
+        cutoff = time.time() - max_age_days * DAY_SECONDS
+        expired = models.Filter(must=[models.FieldCondition(key="ts", range=models.Range(lt=cutoff))])
+        result["expired"] = client.count(collection_name=collection_name, count_filter=expired, exact=True).count
+        if result["expired"] and not dry_run:
+            client.delete(collection_name=collection_name, points_selector=models.FilterSelector(filter=expired))
+
+    if max_points:
+        total = client.count(collection_name=collection_name, exact=True).count
+        if dry_run:
+            total -= result["expired"]
+        if total > max_points:
+            points = [(p.payload.get("ts", 0.0), p.id) for p in iter_points(client, collection_name)]
+            points.sort(key=lambda item: item[0])
+            oldest = [point_id for _, point_id in points[:total - max_points]]
+            result["overflow"] = len(oldest) if dry_run else _delete(client, collection_name, oldest)
+    return result
+
+
+# 合併相似問題，每一群只保留最新的一筆，回傳 {"points": n, "merged": n}
+def compact(client, collection_name: str = DEFAULT_COLLECTION, threshold: float = 0.95,
+            block_size: int = 1024, dry_run: bool = False) -> dict:
+    points = list(iter_points(client, collection_name, with_vectors=True))
+    if not points:
+        return {"points": 0, "merged": 0}
+    # 由新到舊排序：dedup_embeddings 保留每一群中第一個出現的，也就是最新的問答
+    points.sort(key=lambda p: (p.payload or {}).get("ts", 0.0), reverse=True)
+    keep, merged_into = dedup_embeddings(np.asarray([p.vector for p in points]), threshold, block_size)
+
+    if merged_into and not dry_run:
+        # 被合併的 hits 加到保留的那一筆
+        totals = {row: int(points[row].payload.get("hits", 1)) for row in keep}
+        for row, target in merged_into.items():
+            totals[target] += int(points[row].payload.get("hits", 1))
+        for row, hits in totals.items():
+            if hits != int(points[row].payload.get("hits", 1)):
+                client.set_payload(collection_name=collection_name, payload={"hits": hits}, points=[points[row].id])
+        _delete(client, collection_name, [points[row].id for row in merged_into])
+    return {"points": len(points), "merged": len(merged_into)}
+
+
+# 依序執行 backfill、retention、compact
+def maintain(client, collection_name: str = DEFAULT_COLLECTION, max_age_days: float = None,
+             max_points: int = None, threshold: float = 0.95, dry_run: bool = False) -> dict:
+    ensure_payload_indexes(client, collection_name)
+    result = {"backfilled": 0 if dry_run else backfill_ts(client, collection_name)}
+    result.update(apply_retention(client, collection_name, max_age_days, max_points, dry_run))
+    result.update(compact(client, collection_name, threshold, dry_run=dry_run))
+    return result
+
+
+# 背景定期維護 chat_history（第一次在啟動 interval 秒後執行）
+class ChatLogMaintainer:
+    def __init__(self, client, collection_name: str = DEFAULT_COLLECTION, interval: float = 3600.0,
+                 max_age_days: float = 180, max_points: int = 20000, threshold: float = 0.95):
+        self.client = client
+        self.collection_name = collection_name
+        self.interval = interval
+        self.max_age_days = max_age_days
+        self.max_points = max_points
+        self.threshold = threshold
+        self.last_result = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="chatlog-maintainer", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_once(self) -> dict:
+        started = time.perf_counter()
+        result = maintain(self.client, self.collection_name, self.max_age_days, self.max_points, self.threshold)
+        result["seconds"] = round(time.perf_counter() - started, 3)
+        self.last_result = result
+        print(f"🧹 {self.collection_name} 維護完成：{result}")
+        return result
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"❌ {self.collection_name} 維護失敗：{e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="chat_history 的保存期限與合併重複問答")
+    parser.add_argument("command", choices=["backfill", "retention", "compact", "all"])
+    parser.add_argument("--collection", default=DEFAULT_COLLECTION)
+    parser.add_argument("--max-age-days", type=float, help="保存天數")
+    parser.add_argument("--max-points", type=int, help="最多保留幾筆")
+    parser.add_argument("--threshold", type=float, default=0.95, help="視為相同問題的相似度門檻")
+    parser.add_argument("--dry-run", action="store_true", help="只計算，不實際修改")
+    args = parser.parse_args()
+
+    client = get_client()
+    if args.command == "backfill":
+        result = {"backfilled": backfill_ts(client, args.collection)}
+    elif args.command == "retention":
+        result = apply_retention(client, args.collection, args.max_age_days, args.max_points, args.dry_run)
+    elif args.command == "compact":
+        result = compact(client, args.collection, args.threshold, dry_run=args.dry_run)
+    else:
+        result = maintain(client, args.collection, args.max_age_days, args.max_points, args.threshold, args.dry_run)
+    print(f"{'🔍' if args.dry_run else '✅'} {args.collection}：{result}")
+
+
+if __name__ == "__main__":
+    main()
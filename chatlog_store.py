@@ -0,0 +1,226 @@
+import argparse
+import csv
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import metrics
+
+# 問答紀錄的儲存（取代每次回答都重新開啟 CSV 追加一行的做法）
+# - 使用 SQLite（WAL 模式），timestamp 欄位有索引
+# - 請求端只把紀錄放進 queue（微秒等級），由單一背景執行緒批次寫入，一批一個交易（group commit）
+# - 需要給 csv_to_qdrant_chatlog.py 使用時，以 export 匯出成相同格式的 CSV（timestamp,user_question,ai_answer）
+# 用法：
+#   python chatlog_store.py import CSV_chatlog/chat_log2.csv      # 把舊的 CSV 紀錄匯入資料庫
+#   python chatlog_store.py export --output CSV_chatlog/chat_log3.csv [--since "2025-12-01 00:00:00"]
+#   python chatlog_store.py prune --before "2025-01-01 00:00:00"   # 刪除舊紀錄
+
+DEFAULT_DB_PATH = "CSV_chatlog/chat_log.db"
+DEFAULT_EXPORT_PATH = "CSV_chatlog/chat_log3.csv"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+CSV_HEADER = ["timestamp", "user_question", "ai_answer"]
+
+_STOP = object()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chat_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    user_question TEXT NOT NULL,
+    ai_answer TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chat_log_timestamp ON chat_log (timestamp);
+"""
+
+
+# 開啟資料庫連線並確認資料表存在
+def connect(path: str) -> sqlite3.Connection:
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+class ChatLogStore:
+    # path：SQLite 檔案位置
+    # batch_size：一個交易最多寫入幾筆
+    # flush_interval：最多等待幾秒就寫入目前累積的紀錄
+    # max_queue：queue 上限，滿了就丟棄並計數，避免記憶體無限成長
+    def __init__(self, path: str = DEFAULT_DB_PATH, batch_size: int = 200, flush_interval: float = 0.5,
+                 max_queue: int = 10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._conn = connect(path)
+        self._thread = None
+
+    # 啟動背景寫入執行緒
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="chatlog-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    # 加入一筆問答紀錄（只放進 queue，不等待寫入）
+    def append(self, user_question: str, ai_answer: str, timestamp: str = None) -> bool:
+        timestamp = timestamp or datetime.now().strftime(TIMESTAMP_FORMAT)
+        try:
+            self._queue.put_nowait((timestamp, user_question, ai_answer))
+            return True
+        except queue.Full:
+            metrics.inc("rag_chatlog_dropped_total")
+            print(f"❗ 問答紀錄佇列已滿，略過：{user_question[:20]}...")
+            return False
+
+    # 等待目前 queue 中的紀錄都寫入資料庫
+    def flush(self):
+        self._queue.join()
+
+    # 寫完剩下的紀錄並停止背景執行緒
+    def close(self, timeout: float = 10.0):
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    # 一批紀錄在同一個交易中寫入
+    def _write(self, batch):
+        try:
+            with metrics.timer("rag_stage_seconds", stage="chatlog_commit"):
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT INTO chat_log (timestamp, user_question, ai_answer) VALUES (?, ?, ?)",
+                        batch
+                    )
+            metrics.inc("rag_chatlog_written_total", len(batch))
+        except Exception as e:
+            print(f"❌ 寫入問答紀錄發生錯誤：{e}")
+
+    # 資料庫中的紀錄數（另開唯讀連線，WAL 模式下不會擋住寫入）
+    def count(self) -> int:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM chat_log").fetchone()[0]
+        finally:
+            conn.close()
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize(), "rows": self.count()}
+
+
+# 匯出成 csv_to_qdrant_chatlog.py 使用的 CSV 格式，回傳匯出筆數
+def export_csv(db_path: str, output: str, since: str = None, until: str = None) -> int:
+    conn = connect(db_path)
+    sql = "SELECT timestamp, user_question, ai_answer FROM chat_log"
+    conditions, params = [], []
+    if since:
+        conditions.append("timestamp >= ?")
+        params.append(since)
+    if until:
+        conditions.append("timestamp < ?")
+        params.append(until)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY timestamp, id"
+
+    folder = os.path.dirname(output)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    rows = 0
+    with open(output, "w", newline="", encoding="utf-8-sig") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(CSV_HEADER)
+        for row in conn.execute(sql, params):
+            writer.writerow(row)
+            rows += 1
+    conn.close()
+    return rows
+
+
+# 匯入舊的 CSV 紀錄，回傳匯入筆數
+def import_csv(db_path: str, source: str) -> int:
+    conn = connect(db_path)
+    with open(source, newline="", encoding="utf-8-sig") as csvfile:
+        rows = [
+            (row.get("timestamp", ""), row.get("user_question", ""), row.get("ai_answer", ""))
+            for row in csv.DictReader(csvfile)
+            if row.get("user_question")
+        ]
+    with conn:
+        conn.executemany("INSERT INTO chat_log (timestamp, user_question, ai_answer) VALUES (?, ?, ?)", rows)
+    conn.close()
+    return len(rows)
+
+
+# 刪除 before 之前的紀錄，回傳刪除筆數
+def prune(db_path: str, before: str) -> int:
+    conn = connect(db_path)
+    with conn:
+        deleted = conn.execute("DELETE FROM chat_log WHERE timestamp < ?", (before,)).rowcount
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    return deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="問答紀錄資料庫工具")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="SQLite 檔案位置")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="匯出成 CSV")
+    export.add_argument("--output", default=DEFAULT_EXPORT_PATH)
+    export.add_argument("--since", help="只匯出此時間之後（含）的紀錄")
+    export.add_argument("--until", help="只匯出此時間之前的紀錄")
+    importer = sub.add_parser("import", help="匯入舊的 CSV 紀錄")
+    importer.add_argument("csv_path")
+    pruner = sub.add_parser("prune", help="刪除舊紀錄")
+    pruner.add_argument("--before", required=True)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        rows = export_csv(args.db, args.output, args.since, args.until)
+        print(f"✅ 已匯出 {rows} 筆到：{args.output}")
+    elif args.command == "import":
+        rows = import_csv(args.db, args.csv_path)
+        print(f"✅ 已匯入 {rows} 筆：{args.csv_path}")
+    else:
+        deleted = prune(args.db, args.before)
+        print(f"🧹 已刪除 {deleted} 筆 {args.before} 之前的紀錄")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
-from qdrant_client import QdrantClient
 from qdrant_client.http import models
 
-client = QdrantClient("localhost", port=32768)
+from qdrant_collections import CHATLOG_COLLECTION
+from qdrant_provision import get_client
+
+client = get_client()
 
 client.delete(
-    collection_name="chat_history_v2",
+    collection_name=CHATLOG_COLLECTION,
     points_selector=models.FilterSelector(
         filter=models.Filter(must=[])  # must=[] 表示「全部」
     )
@@ -0,0 +1,178 @@
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+import metrics
+
+# 組合送給 LLM 的參考內容
+# - FAQ、原始段落、ChatLog 三個來源中幾乎相同的內容只保留分數最高的一筆（以段落文字本身的向量比對 cosine，
+#   再加上正規化後文字完全相同的比對）
+#   原始段落檢索時取回的就是段落文字的向量；FAQ / ChatLog 存的是「問題」的向量，不能拿來比對答案，
+#   這類段落的 vector 留空，由 encode（例如 EmbeddingStore.encode，答案重複出現時直接取用快取）計算
+# - 依分數由高到低挑選，總長度不超過 token_budget（prompt 越短，prefill 越快）
+# - token 數優先用 LLM 的 tokenizer 計算（CONTEXT_TOKENIZER 指定 HuggingFace 名稱或本地資料夾），
+#   沒有設定或載入失敗時改用估計值
+# 用法：
+#   builder = ContextBuilder(token_budget=1200)
+#   builder = ContextBuilder(token_budget=1200, encode=embeddings.encode)
+#   context = builder.build([Passage("faq", "…", 0.83), Passage("paragraph", "…", 0.71, vector)])
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.95"))
+# 例如 MediaTek-Research/Breeze-7B-Instruct-v1_0（與 LM Studio 載入的模型相同）
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER")
+
+# 各來源的標題，輸出時依此順序分組
+LABELS = {
+    "faq": "【典型問答】",
+    "paragraph": "【相關段落】",
+    "chatlog": "【過往問答】",
+}
+MIN_TRUNCATED_TOKENS = 32  # 最高分的段落放不下時，至少保留這麼多 token 才截斷放入
+
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+# 單一段參考內容：source 為 faq / paragraph / chatlog，vector 為 text 本身的向量（可為 None，由 encode 計算）
+@dataclass
+class Passage:
+    source: str
+    text: str
+    score: float
+    vector: Optional[list] = None
+
+
+# 沒有 tokenizer 時的 token 數估計：中日韓字元每字約 1 token，其他文字約 4 個字元 1 token
+def estimate_tokens(text: str) -> int:
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _normalize_text(text: str) -> str:
+    return re.sub(r"\s+", "", text).lower()
+
+
+class ContextBuilder:
+    # token_budget：參考內容（含標題）的 token 上限
+    # duplicate_threshold：兩段內容向量的 cosine 達此值視為重複
+    # tokenizer：HuggingFace tokenizer 名稱或資料夾，第一次計算 token 時才載入
+    # encode：把文字清單轉成向量矩陣，用來補上沒有 vector 的段落（None 時這些段落只做文字比對）
+    def __init__(self, token_budget: int = CONTEXT_TOKEN_BUDGET, duplicate_threshold: float = DUPLICATE_THRESHOLD,
+                 tokenizer: str = CONTEXT_TOKENIZER, encode=None):
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+        self.encode = encode
+        self.tokenizer_name = tokenizer
+        self._tokenizer = None
+        self._tokenizer_loaded = False
+        self._lock = threading.Lock()
+
+    def _get_tokenizer(self):
+        if not self._tokenizer_loaded:
+            with self._lock:
+                if not self._tokenizer_loaded:
+                    if self.tokenizer_name:
+                        try:
+                            from transformers import AutoTokenizer
+
+                            self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+                            print(f"✅ 已載入 tokenizer：{self.tokenizer_name}")
+                        except Exception as e:
+                            print(f"❗ 無法載入 tokenizer {self.tokenizer_name}，改用估計值：{e}")
+                    self._tokenizer_loaded = True
+        return self._tokenizer
+
+    # 計算文字的 token 數
+    def count_tokens(self, text: str) -> int:
+        tokenizer = self._get_tokenizer()
+        if tokenizer is None:
+            return estimate_tokens(text)
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    # 截斷到 max_tokens 以內
+    def truncate(self, text: str, max_tokens: int) -> str:
+        tokenizer = self._get_tokenizer()
+        if tokenizer is not None:
+            ids = tokenizer.encode(text, add_special_tokens=False)[:max_tokens]
+            return tokenizer.decode(ids, skip_special_tokens=True)
+        # 估計值：逐字累加到上限為止
+        used = 0
+        for i, char in enumerate(text):
+            used += 1 if _CJK.match(char) else 0.25
+            if used > max_tokens:
+                return text[:i]
+        return text
+
+    # 沒有 vector 的段落一次 encode 補上
+    def _with_vectors(self, passages: List[Passage]) -> List[Passage]:
+        missing = [p for p in passages if p.vector is None and (p.text or "").strip()]
+        if self.encode is None or not missing:
+            return passages
+        try:
+            vectors = self.encode([p.text.strip() for p in missing])
+        except Exception as e:
+            print(f"❗ 無法計算參考內容的向量，只以文字比對重複：{e}")
+            return passages
+        filled = {id(p): vector for p, vector in zip(missing, vectors)}
+        return [Passage(p.source, p.text, p.score, filled[id(p)]) if id(p) in filled else p for p in passages]
+
+    # 去除重複並依分數挑選，回傳要放進 context 的段落（依分數由高到低）
+    def select(self, passages: List[Passage]) -> List[Passage]:
+        selected, seen_texts, kept_vectors = [], set(), []
+        used = 0
+        for passage in sorted(self._with_vectors(passages), key=lambda p: p.score, reverse=True):
+            text = (passage.text or "").strip()
+            key = _normalize_text(text)
+            if not key:
+                continue
+            if key in seen_texts or self._near_duplicate(passage.vector, kept_vectors):
+                metrics.inc("rag_context_dropped_total", source=passage.source, reason="duplicate")
+                continue
+
+            cost = self.count_tokens(text)
+            if passage.source not in {p.source for p in selected}:
+                cost += self.count_tokens(LABELS.get(passage.source, ""))
+            remaining = self.token_budget - used
+            if cost > remaining:
+                # 最高分的段落本身就超過上限時截斷放入，其餘放不下的略過（較短的低分段落仍可能放得下）
+                if selected or remaining < MIN_TRUNCATED_TOKENS:
+                    metrics.inc("rag_context_dropped_total", source=passage.source, reason="budget")
+                    continue
+                text = self.truncate(text, remaining - self.count_tokens(LABELS.get(passage.source, "")))
+                cost = remaining
+
+            selected.append(Passage(passage.source, text, passage.score, passage.vector))
+            seen_texts.add(key)
+            if passage.vector is not None:
+                kept_vectors.append(self._unit(passage.vector))
+            used += cost
+        return selected
+
+    # 組成參考內容文字（依來源分組，組內依分數排序），沒有任何內容時回傳 None
+    def build(self, passages: List[Passage]) -> Optional[str]:
+        selected = self.select(passages)
+        if not selected:
+            return None
+        sections = []
+        for source, label in LABELS.items():
+            texts = [p.text for p in selected if p.source == source]
+            if texts:
+                sections.append(label + "\n" + "\n---\n".join(texts))
+        return "\n\n".join(sections)
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm > 0 else array
+
+    def _near_duplicate(self, vector, kept_vectors) -> bool:
+        if vector is None or not kept_vectors:
+            return False
+        unit = self._unit(vector)
+        return any(float(unit @ kept) >= self.duplicate_threshold
+                   for kept in kept_vectors if kept.shape == unit.shape)
@@ -1,14 +1,23 @@
 import os
 import pandas as pd
-from sentence_transformers import SentenceTransformer, util
+from embedding_cache import EmbeddingStore
+from encoders import load_encoder
+from semantic_dedup import dedup_embeddings
 
 # 設定資料夾與模型
 # csv_folder：CSV檔案置放資料夾路徑
 # output_csv：去重病整合後的新CSV檔名
-# model：使用的模型種類
+# report_csv：去重報告（哪一列被併入哪一列），設為 None 則不輸出
+# threshold：cosine similarity 超過此值視為重複
+# block_size：每次一起比對的段落數（越大越快，但記憶體用量越高）
+# model：使用的模型種類（backend 見 encoders.py，外面包一層向量快取，重跑時只 encode 新段落）
 csv_folder = r"C:\Users\Ching\Downloads\CSV_v2"
 output_csv = "merged_deduped_output2-7_demo.csv"
-model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
+report_csv = "merged_deduped_report.csv"
+threshold = 0.9
+block_size = 1024
+encoder = load_encoder()
+model = EmbeddingStore(encoder, encoder.name)
 
 # 記錄所有段落
 paragraphs = []
@@ -26,31 +35,23 @@ for file in os.listdir(csv_folder):
 
 #print(f"總段落數：{len(paragraphs)}")
 
-# 對所有段落做語意向量嵌入
-embeddings = model.encode(paragraphs, convert_to_tensor=True)
-
-# 用 cosine similarity 做語意去重
-unique_paragraphs = [] # 存放「不重複的段落文字」
-unique_embeddings = [] # 存放「不重複段落」對應的向量
-
-# 用 enumerate 來走訪每一段原始段落與對應向量
-for i, (text, emb) in enumerate(zip(paragraphs, embeddings)):
-    is_duplicate = False# 預設這段不是重複的
-
-    # 將目前段落的向量與已經保留的向量逐一比對
-    for u_emb in unique_embeddings:
-        # 使用 cosine similarity 計算語意相似度（越接近 1 越相似）
-        # 如果相似度超過 0.9，視為重複
-        if util.cos_sim(emb, u_emb) > 0.9: 
-            is_duplicate = True # 標記為重複
-            break 
-     # 如果不是重複的，就加入結果清單中
-    if not is_duplicate:
-        unique_paragraphs.append(text) # 保存這段文字
-        unique_embeddings.append(emb) # 保存其向量
+# 對所有段落做語意向量嵌入（正規化在 dedup_embeddings 中處理）
+embeddings = model.encode(paragraphs)
+
+# 用 cosine similarity 做語意去重（保留先出現的段落，見 semantic_dedup.py）
+keep, merged_into = dedup_embeddings(embeddings, threshold=threshold, block_size=block_size)
+unique_paragraphs = [paragraphs[i] for i in keep] # 存放「不重複的段落文字」
 
 # 儲存結果
 df_result = pd.DataFrame({"text": unique_paragraphs})
 df_result.to_csv(output_csv, index=False, encoding="utf-8-sig")
 
+# 儲存去重報告：被移除的段落與它併入的保留段落
+if report_csv:
+    df_report = pd.DataFrame([
+        {"row": row, "kept_row": kept, "text": paragraphs[row], "kept_text": paragraphs[kept]}
+        for row, kept in sorted(merged_into.items())
+    ], columns=["row", "kept_row", "text", "kept_text"])
+    df_report.to_csv(report_csv, index=False, encoding="utf-8-sig")
+
 print(f"✅ 去重後段落數：{len(unique_paragraphs)}，已儲存為：{output_csv}")
@@ -0,0 +1,271 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 向量快取（以內容雜湊為 key）
+# 相同的文字只要 encode 過一次，之後不論是 UI_RAG.py、qdrant_ingest.py 或 data_clean .py 都直接取用
+#
+# 結構：
+#   記憶體 LRU（最常用的向量）→ 磁碟檔（全部向量）→ 都沒有才呼叫模型（批次 encode）
+# 磁碟格式（每個模型一組檔案，只會往後追加）：
+#   <cache_dir>/<model>.f32   float32 向量，一列一筆，以 memmap 讀取
+#   <cache_dir>/<model>.keys  每行一個文字的 sha1（固定 41 bytes），行號即為 .f32 中的列號
+#   <cache_dir>/<model>.lock  多個程式共用同一組檔案時的檔案鎖
+#   <cache_dir>/<model>.gen   壓縮的次數（檔案被替換時加一）
+# 追加時先取得檔案鎖，列號由檔案大小決定（不是由自己記憶體中的筆數），並順便讀入其他程式追加的 key
+# 磁碟筆數超過 max_disk_entries 時壓縮：只保留最新的部分，寫成新檔後替換；
+# 其他程式發現 .gen 改變時會重新讀取索引
+
+DEFAULT_CACHE_DIR = os.getenv(
+    "EMBEDDING_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache")
+)
+DEFAULT_MAX_DISK_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))  # 0 表示不限制
+COMPACT_RATIO = 0.8  # 壓縮後保留 max_disk_entries 的比例（避免每次追加都壓縮）
+KEY_LINE_BYTES = 41  # sha1 hex + "\n"
+
+
+# 跨程式的獨佔檔案鎖
+@contextmanager
+def _file_lock(path: str):
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# 文字內容的雜湊值
+# options 為會改變輸出向量的 encode 參數（例如 normalize_embeddings），不同參數的向量分開存放
+def text_hash(text: str, options: str = "") -> str:
+    content = f"{options}\x1e{text}" if options else text
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+# 不影響向量內容的 encode 參數，不納入快取 key
+_NEUTRAL_OPTIONS = {"show_progress_bar"}
+
+
+def _options_key(kwargs: dict) -> str:
+    options = sorted((k, v) for k, v in kwargs.items() if k not in _NEUTRAL_OPTIONS)
+    return repr(options) if options else ""
+
+
+# 包在模型外面的快取層，encode() 的用法與 SentenceTransformer.encode 相同
+class EmbeddingStore:
+    # model：SentenceTransformer（或任何有 encode(list, batch_size=) 的物件）
+    # model_name：模型名稱，不同模型的向量分開存放
+    # memory_size：記憶體中最多保留幾筆向量
+    # eviction："lru"（淘汰最久沒用的）或 "fifo"（淘汰最早放入的）
+    # persist：False 時只使用記憶體，不讀寫磁碟
+    # max_disk_entries：磁碟最多保留幾筆向量（超過時壓縮，0 表示不限制）
+    def __init__(self, model, model_name: str, dimension: int = 384, cache_dir: str = DEFAULT_CACHE_DIR,
+                 memory_size: int = 10000, eviction: str = "lru", persist: bool = True,
+                 max_disk_entries: int = DEFAULT_MAX_DISK_ENTRIES):
+        if eviction not in ("lru", "fifo"):
+            raise ValueError(f"不支援的淘汰策略：{eviction}")
+        self.model = model
+        self.model_name = model_name
+        self.dimension = dimension
+        self.memory_size = memory_size
+        self.eviction = eviction
+        self.persist = persist
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()  # hash -> 向量
+        self._rows = {}  # hash -> 磁碟檔中的列號
+        self._synced = 0  # 已讀入的磁碟列數
+        self._generation = None  # 目前讀取的磁碟檔是第幾次壓縮後的版本
+        self._disk = None  # 目前的 memmap
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "compactions": 0}
+
+        if persist:
+            os.makedirs(cache_dir, exist_ok=True)
+            safe_name = re.sub(r"[^0-9A-Za-z._-]+", "_", model_name)
+            self.vectors_path = os.path.join(cache_dir, f"{safe_name}.f32")
+            self.keys_path = os.path.join(cache_dir, f"{safe_name}.keys")
+            self.lock_path = os.path.join(cache_dir, f"{safe_name}.lock")
+            self.generation_path = os.path.join(cache_dir, f"{safe_name}.gen")
+            with _file_lock(self.lock_path):
+                for path in (self.vectors_path, self.keys_path):
+                    open(path, "ab").close()
+                self._sync()
+
+    # 磁碟檔目前的版本（每次壓縮加一）
+    def _read_generation(self) -> int:
+        try:
+            with open(self.generation_path, "r", encoding="ascii") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    # 讀入磁碟上新增的 key（需持有檔案鎖）
+    # 只採用向量與 key 都完整寫入的部分；程式中斷留下的未完整尾端會被截掉，讓兩個檔案重新對齊
+    def _sync(self):
+        generation = self._read_generation()
+        if generation != self._generation:  # 第一次讀取，或檔案被其他程式壓縮替換過
+            self._rows, self._synced, self._disk, self._generation = {}, 0, None, generation
+        row_bytes = self.dimension * 4
+        vectors_size = os.path.getsize(self.vectors_path)
+        keys_size = os.path.getsize(self.keys_path)
+        complete = min(vectors_size // row_bytes, keys_size // KEY_LINE_BYTES)
+        if vectors_size != complete * row_bytes or keys_size != complete * KEY_LINE_BYTES:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(complete * row_bytes)
+            with open(self.keys_path, "r+b") as f:
+                f.truncate(complete * KEY_LINE_BYTES)
+        if complete <= self._synced:
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._synced * KEY_LINE_BYTES)
+            data = f.read((complete - self._synced) * KEY_LINE_BYTES).decode("ascii")
+        for i in range(complete - self._synced):
+            self._rows[data[i * KEY_LINE_BYTES:(i + 1) * KEY_LINE_BYTES - 1]] = self._synced + i
+        self._synced = complete
+
+    # 取得磁碟檔中 key 的向量，讀不到時回傳 None（需要時重新 memmap，讓新追加的資料也讀得到）
+    def _read_row(self, key):
+        row = self._rows[key]
+        if self._disk is None or row >= self._disk.shape[0]:
+            if self._read_generation() != self._generation:
+                # 檔案已被其他程式壓縮替換，舊的列號不再適用
+                with _file_lock(self.lock_path):
+                    self._sync()
+                row = self._rows.get(key)
+                if row is None:
+                    return None
+            rows = os.path.getsize(self.vectors_path) // (self.dimension * 4)
+            self._disk = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dimension))
+        return np.array(self._disk[row])
+
+    # 把新向量追加到磁碟（先寫向量再寫 key，中斷時最多遺失最後幾筆）
+    def _append(self, keys, vectors):
+        with _file_lock(self.lock_path):
+            self._sync()
+            if self.max_disk_entries and self._synced + len(keys) > self.max_disk_entries:
+                self._compact(max(int(self.max_disk_entries * COMPACT_RATIO) - len(keys), 0))
+            start = self._synced
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write("".join(f"{key}\n" for key in keys).encode("ascii"))
+            for i, key in enumerate(keys):
+                self._rows[key] = start + i
+            self._synced += len(keys)
+
+    # 只保留最新的 keep 筆（重複的 key 只留一筆），寫成新檔後替換（需持有檔案鎖）
+    def _compact(self, keep: int):
+        latest = sorted(self._rows.items(), key=lambda item: item[1])[-keep:] if keep > 0 else []
+        rows = self._synced
+        disk = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dimension)) \
+            if rows else None
+        with open(self.vectors_path + ".tmp", "wb") as f:
+            for start in range(0, len(latest), 4096):
+                f.write(np.ascontiguousarray(disk[[row for _, row in latest[start:start + 4096]]]).tobytes())
+        with open(self.keys_path + ".tmp", "wb") as f:
+            f.write("".join(f"{key}\n" for key, _ in latest).encode("ascii"))
+        del disk
+        self._disk = None
+        os.replace(self.keys_path + ".tmp", self.keys_path)
+        os.replace(self.vectors_path + ".tmp", self.vectors_path)
+        self._generation += 1
+        with open(self.generation_path + ".tmp", "w", encoding="ascii") as f:
+            f.write(str(self._generation))
+        os.replace(self.generation_path + ".tmp", self.generation_path)
+        self._rows = {key: i for i, (key, _) in enumerate(latest)}
+        self._synced = len(latest)
+        self._counters["compactions"] += 1
+        print(f"🧹 向量快取已壓縮：{rows} → {len(latest)} 筆（{self.vectors_path}）")
+
+    # 放進記憶體快取，超過上限時依淘汰策略移除
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    # 與 SentenceTransformer.encode 相同：輸入字串回傳一維向量，輸入清單回傳 (n, dim) 矩陣
+    # batch_size 未指定時不傳給模型，由模型自己的設定決定（例如 ENCODER_BATCH_SIZE）
+    # 其他參數（例如 normalize_embeddings=True）會影響向量內容，一併納入快取 key
+    def encode(self, sentences, batch_size: int = None, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        options = _options_key(kwargs)
+        keys = [text_hash(text, options) for text in texts]
+        result = np.empty((len(texts), self.dimension), dtype=np.float32)
+        missing = OrderedDict()  # hash -> 第一次出現的文字（同一批重複的文字只 encode 一次）
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    if self.eviction == "lru":
+                        self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    result[i] = vector
+                    continue
+                if key in self._rows:
+                    vector = self._read_row(key)
+                    if vector is not None:
+                        self._remember(key, vector)
+                        self._counters["disk_hits"] += 1
+                        result[i] = vector
+                        continue
+                if key not in missing:
+                    missing[key] = texts[i]
+
+        if missing:
+            # 模型 encode 不佔用鎖，其他執行緒仍可讀取快取
+            if batch_size is not None:
+                kwargs["batch_size"] = batch_size
+            vectors = np.asarray(self.model.encode(list(missing.values()), **kwargs), dtype=np.float32)
+            with self._lock:
+                new_keys, new_vectors = [], []
+                for key, vector in zip(missing, vectors):
+                    self._counters["misses"] += 1
+                    self._remember(key, vector)
+                    if self.persist and key not in self._rows:
+                        new_keys.append(key)
+                        new_vectors.append(vector)
+                if new_keys:
+                    self._append(new_keys, np.stack(new_vectors))
+            computed = dict(zip(missing, vectors))
+            for i, key in enumerate(keys):
+                if key in computed:
+                    result[i] = computed[key]
+
+        return result[0] if single else result
+
+    # 快取狀態與命中率
+    def stats(self) -> dict:
+        with self._lock:
+            result = dict(self._counters)
+            result["memory_entries"] = len(self._memory)
+            result["disk_entries"] = len(self._rows)
+        result["max_disk_entries"] = self.max_disk_entries
+        lookups = result["memory_hits"] + result["disk_hits"] + result["misses"]
+        result["hit_rate"] = (result["memory_hits"] + result["disk_hits"]) / lookups if lookups else 0.0
+        result["memory_size"] = self.memory_size
+        result["eviction"] = self.eviction
+        result["model_name"] = self.model_name
+        return result
@@ -0,0 +1,84 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from encoders import BACKENDS, load_encoder
+
+# 比較各 encoder backend 的速度與向量一致度
+# 以 torch（fp32）為基準，對 repo 內的 FAQ 問題與文件段落 encode，回報：
+#   每秒處理筆數、相對 fp32 的加速倍數、與 fp32 向量的 cosine similarity（平均 / 最低 / 第 1 百分位）
+# 用法：
+#   python encoder_check.py --backends int8 onnx --onnx-dir models/minilm-onnx --threads 4
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_FILES = [
+    (os.path.join(BASE_DIR, "CSV_QAHv1", "QA_HV1.csv"), "question"),
+    (os.path.join(BASE_DIR, "CSV_v3", "merged_deduped_output2-17_demo.csv"), "text"),
+]
+
+
+# 讀入測試用文字
+def load_samples(limit: int):
+    texts = []
+    for path, column in SAMPLE_FILES:
+        df = pd.read_csv(path, encoding="utf-8-sig")
+        texts.extend(df[column].dropna().astype(str).str.strip().tolist())
+    texts = [t for t in texts if t]
+    return texts[:limit]
+
+
+# encode 全部文字並計時（先暖機一次，避免把模型初始化算進去）
+def timed_encode(encoder, texts, repeat: int):
+    encoder.encode(texts[:8])
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        vectors = np.asarray(encoder.encode(texts), dtype=np.float32)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return vectors, best
+
+
+def cosine_rows(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較 encoder backend 的速度與準確度")
+    parser.add_argument("--backends", nargs="+", default=["int8"], choices=[b for b in BACKENDS if b != "torch"])
+    parser.add_argument("--model-dir", help="torch / int8 使用的本地模型資料夾")
+    parser.add_argument("--onnx-dir", help="onnx 使用的模型資料夾（含 model.onnx）")
+    parser.add_argument("--threads", type=int, help="CPU 執行緒數")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--limit", type=int, default=1000, help="最多使用幾筆測試文字")
+    parser.add_argument("--repeat", type=int, default=3, help="每個 backend 重複量測次數（取最快）")
+    args = parser.parse_args()
+
+    texts = load_samples(args.limit)
+    print(f"測試文字：{len(texts)} 筆，threads={args.threads or '預設'}，batch_size={args.batch_size}")
+
+    reference = load_encoder("torch", model_dir=args.model_dir, threads=args.threads, batch_size=args.batch_size)
+    ref_vectors, ref_time = timed_encode(reference, texts, args.repeat)
+    print(f"{'backend':<8}{'筆/秒':>10}{'加速':>8}{'cos 平均':>10}{'cos 最低':>10}{'cos p1':>10}")
+    print(f"{'torch':<8}{len(texts) / ref_time:>10.1f}{1.0:>8.2f}{1.0:>10.4f}{1.0:>10.4f}{1.0:>10.4f}")
+
+    for backend in args.backends:
+        model_dir = args.onnx_dir if backend == "onnx" else args.model_dir
+        try:
+            encoder = load_encoder(backend, model_dir=model_dir, threads=args.threads, batch_size=args.batch_size)
+        except Exception as e:
+            print(f"{backend:<8}無法載入：{e}")
+            continue
+        vectors, elapsed = timed_encode(encoder, texts, args.repeat)
+        cos = cosine_rows(ref_vectors, vectors)
+        print(f"{backend:<8}{len(texts) / elapsed:>10.1f}{ref_time / elapsed:>8.2f}"
+              f"{cos.mean():>10.4f}{cos.min():>10.4f}{np.percentile(cos, 1):>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import os
+
+import numpy as np
+
+# 可替換的文字向量模型（encoder）
+# UI_RAG.py、qdrant_ingest.py、data_clean .py 都透過 load_encoder() 取得 encoder，
+# 用法與 SentenceTransformer.encode 相同，可選擇以下 backend：
+#   torch：原本的 SentenceTransformer（fp32）
+#   int8 ：SentenceTransformer 的 Linear 層做 PyTorch 動態 int8 量化
+#   onnx ：ONNX Runtime 執行從本地資料夾載入的 model.onnx（可用 export_onnx() 產生）
+# 預設值可用環境變數調整：ENCODER_BACKEND、ENCODER_MODEL_DIR、ENCODER_THREADS、ENCODER_BATCH_SIZE
+# 不同 backend 的向量會有些微差異，可用 encoder_check.py 比較速度與 cosine 一致度
+
+MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+BACKENDS = ("torch", "int8", "onnx")
+
+
+# 原本的 SentenceTransformer（PyTorch fp32）
+class SentenceTransformerEncoder:
+    backend = "torch"
+
+    # model：模型名稱或本地資料夾；threads：CPU 執行緒數（None 表示使用預設值）
+    def __init__(self, model: str = MODEL_NAME, threads: int = None, batch_size: int = 64):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.model_name = model
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model, device="cpu")
+
+    # 給向量快取使用的名稱，不同 backend 的向量分開存放
+    @property
+    def name(self) -> str:
+        base = os.path.basename(os.path.normpath(self.model_name))
+        return base if self.backend == "torch" else f"{base}@{self.backend}"
+
+    def encode(self, sentences, batch_size: int = None, **kwargs):
+        return self.model.encode(sentences, batch_size=batch_size or self.batch_size, **kwargs)
+
+
+# Linear 層動態量化成 int8 的 SentenceTransformer（只在 CPU 上有效）
+class QuantizedEncoder(SentenceTransformerEncoder):
+    backend = "int8"
+
+    def __init__(self, model: str = MODEL_NAME, threads: int = None, batch_size: int = 64):
+        import torch
+
+        super().__init__(model, threads=threads, batch_size=batch_size)
+        self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+# ONNX Runtime 版本：tokenizer + ONNX transformer + mean pooling（與原模型的 Pooling 設定相同）
+class OnnxEncoder:
+    backend = "onnx"
+
+    # model_dir：包含 tokenizer 檔案與 model.onnx 的資料夾
+    def __init__(self, model_dir: str, threads: int = None, batch_size: int = 64, max_length: int = 128):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        onnx_path = os.path.join(model_dir, "model.onnx")
+        if not os.path.exists(onnx_path):
+            onnx_path = os.path.join(model_dir, "onnx", "model.onnx")
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(f"找不到 ONNX 模型：{model_dir}（可先執行 export_onnx()）")
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model_name = model_dir
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    @property
+    def name(self) -> str:
+        return f"{os.path.basename(os.path.normpath(self.model_name))}@onnx"
+
+    def encode(self, sentences, batch_size: int = None, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        batch_size = batch_size or self.batch_size
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np"
+            )
+            feeds = {k: v.astype(np.int64) for k, v in tokens.items() if k in self.input_names}
+            token_embeddings = self.session.run(None, feeds)[0]
+            # mean pooling：只平均非 padding 的 token
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            summed = (token_embeddings * mask).sum(axis=1)
+            outputs.append(summed / np.clip(mask.sum(axis=1), 1e-9, None))
+        result = np.concatenate(outputs) if outputs else np.empty((0, 384), dtype=np.float32)
+        return result[0] if single else result
+
+
+# 把 SentenceTransformer 的 transformer 部分匯出成 ONNX，連同 tokenizer 存到 output_dir
+def export_onnx(output_dir: str, model: str = MODEL_NAME):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(output_dir, exist_ok=True)
+    st_model = SentenceTransformer(model, device="cpu")
+    transformer = st_model[0].auto_model
+    tokenizer = st_model.tokenizer
+    transformer.eval()
+
+    dummy = tokenizer(["範例文字"], return_tensors="pt")
+    # 新版 torch 預設的 dynamo 匯出器原生輸出 opset 18；指定較低的版本時會先印出轉換失敗的錯誤才退回
+    torch.onnx.export(
+        transformer,
+        (dummy["input_ids"], dummy["attention_mask"]),
+        os.path.join(output_dir, "model.onnx"),
+        input_names=["input_ids", "attention_mask"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "last_hidden_state": {0: "batch", 1: "sequence"},
+        },
+        opset_version=18
+    )
+    tokenizer.save_pretrained(output_dir)
+    print(f"✅ 已匯出 ONNX 模型到：{output_dir}")
+
+
+# 依設定建立 encoder；未指定的參數使用環境變數，再沒有就用預設值
+# backend 未指定時，backend 與 model_dir 都取自環境變數（避免 onnx 的資料夾被拿去給 torch 使用）
+# model_dir：本地模型資料夾（onnx 必填；torch / int8 未指定時使用 MODEL_NAME）
+def load_encoder(backend: str = None, model_dir: str = None, threads: int = None, batch_size: int = None):
+    if backend is None:
+        backend = os.getenv("ENCODER_BACKEND", "torch")
+        model_dir = model_dir or os.getenv("ENCODER_MODEL_DIR") or None
+    threads = threads or int(os.getenv("ENCODER_THREADS", "0")) or None
+    batch_size = batch_size or int(os.getenv("ENCODER_BATCH_SIZE", "64"))
+
+    if backend == "torch":
+        return SentenceTransformerEncoder(model_dir or MODEL_NAME, threads=threads, batch_size=batch_size)
+    if backend == "int8":
+        return QuantizedEncoder(model_dir or MODEL_NAME, threads=threads, batch_size=batch_size)
+    if backend == "onnx":
+        if not model_dir:
+            raise ValueError("onnx backend 需要指定 model_dir（或環境變數 ENCODER_MODEL_DIR）")
+        return OnnxEncoder(model_dir, threads=threads, batch_size=batch_size)
+    raise ValueError(f"不支援的 encoder backend：{backend}（可用：{', '.join(BACKENDS)}）")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="匯出 ONNX 版本的向量模型")
+    parser.add_argument("output_dir", help="輸出資料夾（之後作為 ENCODER_MODEL_DIR）")
+    parser.add_argument("--model", default=MODEL_NAME)
+    args = parser.parse_args()
+    export_onnx(args.output_dir, args.model)
@@ -0,0 +1,143 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from lmstudio_client import MODEL_NAME
+
+# 假的 LM Studio（OpenAI 相容接口），壓測與離線測試時取代真正的模型
+# 支援：
+#   GET  /v1/models            回傳 MODEL_NAME
+#   POST /v1/chat/completions  依設定的延遲產生固定內容的回答（stream 為 true 時以 SSE 逐 token 回傳）
+# 用法：
+#   python fake_lmstudio.py --port 1234 --first-token-ms 300 --token-ms 30 --tokens 60
+
+DEFAULT_ANSWER_TOKEN = "預"
+
+
+# 用戶端關閉 keep-alive 連線時不印出錯誤
+class _QuietHTTPServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class FakeLMStudioServer:
+    # first_token_ms：收到請求到第一個 token 的延遲（模擬 prefill）
+    # token_ms：之後每個 token 的間隔（模擬 decode）
+    # tokens：每次回答的 token 數
+    def __init__(self, host="127.0.0.1", port=0, first_token_ms=200.0, token_ms=20.0, tokens=60):
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        self.tokens = tokens
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = _QuietHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-lmstudio", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, body: dict):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/v1/models":
+                    self._send_json({"object": "list", "data": [{"id": MODEL_NAME, "object": "model"}]})
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                if self.path.rstrip("/") != "/v1/chat/completions":
+                    self.send_error(404)
+                    return
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                time.sleep(server.first_token_ms / 1000)
+                if payload.get("stream"):
+                    self._stream()
+                else:
+                    time.sleep(server.token_ms * max(server.tokens - 1, 0) / 1000)
+                    self._send_json({
+                        "object": "chat.completion",
+                        "model": MODEL_NAME,
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": DEFAULT_ANSWER_TOKEN * server.tokens}}],
+                    })
+
+            # 以 SSE 逐 token 回傳（chunked transfer encoding）
+            def _stream(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def write_event(data: str):
+                    event = f"data: {data}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(event):X}\r\n".encode("ascii") + event + b"\r\n")
+                    self.wfile.flush()
+
+                for i in range(server.tokens):
+                    if i > 0:
+                        time.sleep(server.token_ms / 1000)
+                    chunk = {"object": "chat.completion.chunk", "model": MODEL_NAME,
+                             "choices": [{"index": 0, "delta": {"content": DEFAULT_ANSWER_TOKEN}, "finish_reason": None}]}
+                    write_event(json.dumps(chunk, ensure_ascii=False))
+                write_event("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="假的 LM Studio（OpenAI 相容）伺服器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--first-token-ms", type=float, default=200.0)
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    parser.add_argument("--tokens", type=int, default=60)
+    args = parser.parse_args()
+
+    server = FakeLMStudioServer(args.host, args.port, args.first_token_ms, args.token_ms, args.tokens)
+    print(f"🤖 假的 LM Studio 已啟動：{server.url}")
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+
+import requests
+from flask import Flask, request, jsonify
+
+# 本地測試用的 LINE Messaging API 替身
+# 1. 啟動替身伺服器（記錄 reply / push 的內容）：
+#      python line_api_stub.py serve --port 8081 [--fail-reply]
+#    並以 LINE_API_ENDPOINT=http://127.0.0.1:8081 啟動 UI_RAG.py
+# 2. 送出帶有正確簽章的 webhook 事件到 /callback（可用 --repeat 模擬 LINE 重送）：
+#      python line_api_stub.py send "什麼是預立醫療決定？" --callback http://127.0.0.1:5000/callback
+# 3. 查看收到的訊息：GET http://127.0.0.1:8081/stub/messages
+
+LINE_CHANNEL_SECRET = os.getenv("LINE_CHANNEL_SECRET", "113f99564b7941732e96c4fd1debf395")
+
+stub_app = Flask(__name__)
+_messages = []
+_messages_lock = threading.Lock()
+_options = {"fail_reply": False}
+
+
+# 記錄收到的訊息
+def _record(kind: str, body: dict):
+    with _messages_lock:
+        _messages.append({"kind": kind, "received_at": time.time(), "body": body})
+    texts = [m.get("text", "") for m in body.get("messages", [])]
+    print(f"📨 [{kind}] {texts}")
+
+
+@stub_app.route("/v2/bot/message/reply", methods=["POST"])
+def reply():
+    body = request.get_json(force=True)
+    # 模擬 reply token 已過期
+    if _options["fail_reply"]:
+        _record("reply-rejected", body)
+        return jsonify({"message": "Invalid reply token"}), 400
+    _record("reply", body)
+    return jsonify({})
+
+
+@stub_app.route("/v2/bot/message/push", methods=["POST"])
+def push():
+    _record("push", request.get_json(force=True))
+    return jsonify({})
+
+
+@stub_app.route("/stub/messages", methods=["GET"])
+def messages():
+    with _messages_lock:
+        return jsonify(list(_messages))
+
+
+# 組出一個文字訊息的 webhook 內容
+def build_webhook_body(text: str, user_id: str = "Ustub0000000000000000000000000000", event_id: str = None) -> str:
+    event = {
+        "type": "message",
+        "mode": "active",
+        "timestamp": int(time.time() * 1000),
+        "source": {"type": "user", "userId": user_id},
+        "webhookEventId": event_id or uuid.uuid4().hex,
+        "deliveryContext": {"isRedelivery": False},
+        "replyToken": uuid.uuid4().hex,
+        "message": {"id": str(int(time.time() * 1000)), "type": "text", "text": text},
+    }
+    return json.dumps({"destination": "Ustub", "events": [event]}, ensure_ascii=False)
+
+
+# 用 channel secret 計算 X-Line-Signature
+def sign(body: str, secret: str = LINE_CHANNEL_SECRET) -> str:
+    digest = hmac.new(secret.encode("utf-8"), body.encode("utf-8"), hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+
+# 送出 webhook；repeat > 1 時以相同 webhookEventId 重送，模擬 LINE 的 redelivery
+def send_webhook(text: str, callback_url: str, repeat: int = 1):
+    event_id = uuid.uuid4().hex
+    for i in range(repeat):
+        body = build_webhook_body(text, event_id=event_id)
+        if i > 0:
+            body = body.replace('"isRedelivery": false', '"isRedelivery": true')
+        started = time.monotonic()
+        response = requests.post(
+            callback_url,
+            data=body.encode("utf-8"),
+            headers={"Content-Type": "application/json", "X-Line-Signature": sign(body)},
+            timeout=10
+        )
+        elapsed = (time.monotonic() - started) * 1000
+        print(f"➡ webhook #{i + 1}：HTTP {response.status_code}，{elapsed:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 LINE Messaging API 替身")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve", help="啟動替身伺服器")
+    serve.add_argument("--port", type=int, default=8081)
+    serve.add_argument("--fail-reply", action="store_true", help="reply 一律失敗，用來測試 push 備援")
+    send = sub.add_parser("send", help="送出帶簽章的 webhook 事件")
+    send.add_argument("text")
+    send.add_argument("--callback", default="http://127.0.0.1:5000/callback")
+    send.add_argument("--repeat", type=int, default=1, help="以同一個事件 id 重送的次數")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        _options["fail_reply"] = args.fail_reply
+        stub_app.run(host="127.0.0.1", port=args.port)
+    else:
+        send_webhook(args.text, args.callback, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+
+# LINE webhook 事件的背景處理池
+# /callback 驗證簽章後只把事件放進有上限的 queue 就立刻回 "OK"，
+# 由固定數量的 worker 執行緒在背景做檢索、產生回答並送出訊息
+class LineDispatcher:
+    # process：實際處理一個事件的函式，參數為 (event, received_at)
+    # max_workers：同時處理的事件數
+    # max_queue：排隊中的事件上限，超過就拒收（backpressure）
+    # dedup_size：記住最近多少個事件 id，用來丟棄 LINE 的重送事件
+    def __init__(self, process, max_workers=4, max_queue=100, dedup_size=1000):
+        self.process = process
+        self.max_workers = max_workers
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._seen = OrderedDict()
+        self._dedup_size = dedup_size
+        self._lock = threading.Lock()
+        self._threads = []
+        self._active = 0
+        self._counters = {"accepted": 0, "completed": 0, "failed": 0, "rejected": 0, "duplicates": 0}
+
+    # 啟動 worker 執行緒
+    def start(self):
+        if not self._threads:
+            for i in range(self.max_workers):
+                thread = threading.Thread(target=self._run, name=f"line-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    # 事件的唯一識別：優先使用 webhookEventId，舊版 SDK 沒有時改用 reply token
+    @staticmethod
+    def event_key(event):
+        return getattr(event, "webhook_event_id", None) or getattr(event, "reply_token", None)
+
+    # 放入一個事件；回傳 "accepted" / "duplicate" / "busy"
+    def submit(self, event) -> str:
+        key = self.event_key(event)
+        with self._lock:
+            if key is not None and key in self._seen:
+                self._counters["duplicates"] += 1
+                return "duplicate"
+            try:
+                self._queue.put_nowait((event, time.monotonic()))
+            except queue.Full:
+                self._counters["rejected"] += 1
+                return "busy"
+            if key is not None:
+                self._seen[key] = True
+                if len(self._seen) > self._dedup_size:
+                    self._seen.popitem(last=False)
+            self._counters["accepted"] += 1
+        return "accepted"
+
+    # 目前的處理狀況（排隊數、處理中數量與各項計數）
+    def stats(self) -> dict:
+        with self._lock:
+            result = dict(self._counters)
+            result["active"] = self._active
+        result["queued"] = self._queue.qsize()
+        result["queue_capacity"] = self._queue.maxsize
+        result["workers"] = self.max_workers
+        return result
+
+    # worker：不斷從 queue 取出事件處理，單一事件出錯不影響其他事件
+    def _run(self):
+        while True:
+            event, received_at = self._queue.get()
+            with self._lock:
+                self._active += 1
+            try:
+                self.process(event, received_at)
+                outcome = "completed"
+            except Exception as e:
+                print(f"❌ LINE 事件處理失敗：{e}")
+                outcome = "failed"
+            with self._lock:
+                self._active -= 1
+                self._counters[outcome] += 1
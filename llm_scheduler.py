@@ -0,0 +1,212 @@
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import metrics
+
+# LM Studio 前面的排程器：所有生成請求都經過這裡，不再由每個 Gradio / LINE 請求直接呼叫
+# - 固定數量的 worker 執行緒（max_concurrency）同時生成，其餘進入有上限的 queue
+# - queue 已滿，或排隊超過 queue_timeout 秒還沒開始生成 → 丟出 SchedulerBusy，呼叫端立刻回覆「忙碌中」
+# - 參考內容與問題完全相同的請求若已在排隊或生成中，直接共用同一次生成（串流的每個 token 也會同步給所有等待者）
+# - 生成失敗（包含已經產生部分內容後才中斷）→ 所有等待者讀完已產生的片段後丟出 GenerationFailed
+# 用法：
+#   scheduler = LLMScheduler(stream_lmstudio, max_concurrency=2, max_queue=16, queue_timeout=30).start()
+#   for piece in scheduler.stream(context, question):
+#       ...
+
+
+class SchedulerBusy(Exception):
+    pass
+
+
+# 生成過程中發生錯誤；partial 為錯誤發生前已產生的文字
+class GenerationFailed(Exception):
+    def __init__(self, message: str, partial: str = ""):
+        super().__init__(message)
+        self.partial = partial
+
+
+_STOP = object()
+
+
+# 一次生成：產生的片段存在 pieces，所有共用這次生成的請求各自從頭讀取
+class _Generation:
+    def __init__(self, key, deadline: float):
+        self.key = key
+        self.enqueued_at = time.monotonic()
+        self.deadline = deadline
+        self.pieces = []
+        self.started = False
+        self.cancelled = False
+        self.done = False
+        self.error = None  # 生成失敗時的例外
+        self.cond = threading.Condition()
+
+
+class LLMScheduler:
+    # generate：串流生成函式，參數為 (context, question)，逐段 yield 文字（例如 stream_lmstudio）
+    # max_concurrency：同時送給 LM Studio 的生成數
+    # max_queue：排隊中的生成上限，超過就立刻拒絕
+    # queue_timeout：排隊等待開始生成的秒數上限
+    def __init__(self, generate, max_concurrency: int = 2, max_queue: int = 16, queue_timeout: float = 30.0,
+                 wait_window: int = 1000):
+        self.generate = generate
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._inflight = {}  # (context, question) -> _Generation（排隊中或生成中）
+        self._lock = threading.Lock()
+        self._threads = []
+        self._active = 0
+        self._waits = deque(maxlen=wait_window)  # 最近的排隊等待秒數
+        self._counters = {"submitted": 0, "coalesced": 0, "completed": 0, "rejected": 0, "expired": 0,
+                          "failed": 0}
+
+    # 啟動 worker 執行緒
+    def start(self):
+        if not self._threads:
+            for i in range(self.max_concurrency):
+                thread = threading.Thread(target=self._run, name=f"llm-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    # 停止 worker（正在生成的會先完成）
+    def close(self, timeout: float = 5.0):
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    # 串流生成：逐段 yield 新產生的文字；忙碌時丟出 SchedulerBusy（尚未 yield 任何內容）
+    # 生成失敗時先 yield 完已產生的片段，再丟出 GenerationFailed
+    def stream(self, context: str, question: str):
+        generation = self._join((context, question))
+        index = 0
+        while True:
+            with generation.cond:
+                while index >= len(generation.pieces) and not generation.done and not generation.cancelled:
+                    if generation.started:
+                        generation.cond.wait()  # 開始生成後的逾時由 generate 自己處理
+                        continue
+                    remaining = generation.deadline - time.monotonic()
+                    if remaining <= 0:
+                        generation.cancelled = True
+                        generation.cond.notify_all()
+                        break
+                    generation.cond.wait(remaining)
+                if generation.cancelled:
+                    break
+                pieces = generation.pieces[index:]
+                finished = generation.done
+                error = generation.error
+            index += len(pieces)
+            for piece in pieces:
+                yield piece
+            if finished and index >= len(generation.pieces):
+                if error is not None:
+                    raise GenerationFailed(str(error), "".join(generation.pieces))
+                return
+        self._expire(generation)
+        raise SchedulerBusy(f"LLM 排隊超過 {self.queue_timeout} 秒")
+
+    # 一次取得完整回答（生成失敗時丟出 GenerationFailed）
+    def ask(self, context: str, question: str) -> str:
+        return "".join(self.stream(context, question)).strip()
+
+    # 加入相同請求的生成，或排入新的生成
+    def _join(self, key) -> _Generation:
+        with self._lock:
+            generation = self._inflight.get(key)
+            if generation is not None and not generation.cancelled:
+                self._counters["coalesced"] += 1
+                metrics.inc("rag_llm_scheduler_total", result="coalesced")
+                return generation
+            generation = _Generation(key, time.monotonic() + self.queue_timeout)
+            try:
+                self._queue.put_nowait(generation)
+            except queue.Full:
+                self._counters["rejected"] += 1
+                metrics.inc("rag_llm_scheduler_total", result="rejected")
+                raise SchedulerBusy("LLM 排隊人數已滿")
+            self._inflight[key] = generation
+            self._counters["submitted"] += 1
+            metrics.inc("rag_llm_scheduler_total", result="submitted")
+            return generation
+
+    # 排隊逾時：之後的相同請求改排新的生成
+    def _expire(self, generation: _Generation):
+        with self._lock:
+            if self._inflight.get(generation.key) is generation:
+                del self._inflight[generation.key]
+                self._counters["expired"] += 1
+                metrics.inc("rag_llm_scheduler_total", result="expired")
+
+    def _finish(self, generation: _Generation):
+        with self._lock:
+            if self._inflight.get(generation.key) is generation:
+                del self._inflight[generation.key]
+        with generation.cond:
+            generation.done = True
+            generation.cond.notify_all()
+
+    # worker：取出一個生成並執行，把每個片段交給所有等待者
+    def _run(self):
+        while True:
+            generation = self._queue.get()
+            if generation is _STOP:
+                return
+            with generation.cond:
+                if generation.cancelled or time.monotonic() > generation.deadline:
+                    generation.cancelled = True
+                    generation.cond.notify_all()
+                    skip = True
+                else:
+                    generation.started = True
+                    skip = False
+            if skip:
+                self._expire(generation)
+                continue
+
+            wait = time.monotonic() - generation.enqueued_at
+            metrics.observe("rag_llm_queue_seconds", wait)
+            with self._lock:
+                self._waits.append(wait)
+                self._active += 1
+            try:
+                context, question = generation.key
+                for piece in self.generate(context, question):
+                    with generation.cond:
+                        generation.pieces.append(piece)
+                        generation.cond.notify_all()
+            except Exception as e:
+                with generation.cond:
+                    generation.error = e
+                with self._lock:
+                    self._counters["failed"] += 1
+                metrics.inc("rag_llm_scheduler_total", result="failed")
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._counters["completed"] += 1
+                self._finish(generation)
+
+    # 目前的狀況：排隊數、生成中數量、各項計數與最近的排隊等待時間
+    def stats(self) -> dict:
+        with self._lock:
+            result = dict(self._counters)
+            result["active"] = self._active
+            result["inflight"] = len(self._inflight)
+            waits = np.asarray(self._waits, dtype=np.float64)
+        result["queued"] = self._queue.qsize()
+        result["queue_capacity"] = self._queue.maxsize
+        result["max_concurrency"] = self.max_concurrency
+        if waits.size:
+            result["wait_p50_ms"] = round(float(np.percentile(waits, 50)) * 1000, 3)
+            result["wait_p95_ms"] = round(float(np.percentile(waits, 95)) * 1000, 3)
+            result["wait_max_ms"] = round(float(waits.max()) * 1000, 3)
+        return result
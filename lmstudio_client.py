@@ -0,0 +1,106 @@
+import json
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# LM Studio（OpenAI 相容接口）的呼叫方式
+# 所有請求共用同一個 keep-alive 的 requests.Session，不必每次重新建立連線
+
+# url：LM Studio 的 API 端點（預設是本地的 OpenAI 接口）
+LMSTUDIO_URL = "http://127.0.0.1:1234/v1/chat/completions"
+MODELS_URL = "http://127.0.0.1:1234/v1/models"  # 列出已載入模型的端點（健康檢查用）
+MODEL_NAME = "breeze-7b-instruct-v1_0"  # 使用的模型種類
+TEMPERATURE = 0.7  # 控制回答的創造力（0 越穩定，1 越有創意）
+
+# 逾時設定（秒）
+CONNECT_TIMEOUT = 5  # 建立連線的時間上限，連不到 LM Studio 時能很快回報錯誤
+READ_TIMEOUT = 600  # 非串流：等待整段回答的時間上限
+FIRST_TOKEN_TIMEOUT = 120  # 串流：等待第一個 token（以及任兩個 token 之間）的時間上限
+PROBE_TIMEOUT = 3  # 健康檢查的讀取時間上限
+POOL_SIZE = 16  # 連線池大小
+
+_session = None
+_session_lock = threading.Lock()
+
+
+# 取得共用的 HTTP session（第一次呼叫時建立）
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+# 系統提示：設定 AI 的角色與語言
+# 每次請求都完全相同、且放在最前面，LM Studio 可以重複使用這段 prompt 的快取（只需 prefill 後面的參考內容與問題）
+# 請不要在這裡加入時間、使用者等每次不同的內容
+SYSTEM_PROMPT = "你是繁體中文知識助手，請根據參考內容簡短回答問題(不超出60字)，在回答時必須完全依照參考內容，請不要擅加資訊，也請不要回答任何與醫療不相關的問題"
+
+
+# 設定要送給模型的資料（payload），模仿 OpenAI 的 Chat API 格式
+def build_payload(context: str, question: str, stream: bool) -> dict:
+    return {
+        "model": MODEL_NAME,
+        "messages": [
+            ##{"role": "system", "content": "你是繁體中文知識助手，請根據參考內容並自行補充合理內容來回答使用者問題。"},# 系統提示：設定 AI 的角色與語言
+            ##{"role": "user", "content": f"以下是參考內容：\n{context}\n\n問題：{question}"} # 使用者輸入的上下文與問題
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": f"以下是根據資料庫查詢到的參考答案：\n{context}\n\n請根據此參考內容與你的理解來回答使用者的問題：{question}，但若是使用者的問題與醫療毫無相關請統一回復：抱歉！您的提問與預立醫療並無相關，若還有其他問題歡迎提問~，並且不要再加上更多回復"}
+        ],
+        "temperature": TEMPERATURE,
+        "stream": stream  # 是否開啟串流回答
+    }
+
+
+# 健康檢查：確認 LM Studio 可連線且有提供 MODEL_NAME，回傳簡短說明，失敗時丟出例外
+def probe_lmstudio() -> str:
+    response = get_session().get(MODELS_URL, timeout=(CONNECT_TIMEOUT, PROBE_TIMEOUT))
+    response.raise_for_status()
+    model_ids = [m.get("id") for m in response.json().get("data", [])]
+    if MODEL_NAME not in model_ids:
+        raise RuntimeError(f"LM Studio 沒有提供 {MODEL_NAME}（目前：{model_ids}）")
+    return f"{MODEL_NAME} 可使用"
+
+
+# 呼叫 LM Studio 模型並取得模型回答（一次回傳整段）
+def ask_lmstudio(context: str, question: str) -> str:
+    payload = build_payload(context, question, stream=False)
+    try:
+        response = get_session().post(LMSTUDIO_URL, json=payload, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)) # 將資料（payload）透過 HTTP POST 傳給 LM Studio 的 API
+        response.raise_for_status() # 如果發生 HTTP 錯誤（例如 404、500）會丟出例外
+        result = response.json() # 解析回傳的 JSON 結果
+        return result["choices"][0]["message"]["content"].strip() # 從 JSON 裡取出模型的回答內容並移除多餘空白
+
+    # 如果發生錯誤（如連不到模型或資料格式錯誤），回傳錯誤訊息
+    except Exception as e:
+        return f"❌ 發生錯誤：{e}"
+
+
+# 串流呼叫 LM Studio：讀取 SSE（data: {...}）並逐段 yield 新產生的文字
+# 發生錯誤時直接丟出例外（可能已經 yield 過部分內容），不把錯誤訊息混在回答文字中
+def stream_lmstudio(context: str, question: str):
+    payload = build_payload(context, question, stream=True)
+    with get_session().post(LMSTUDIO_URL, json=payload, stream=True,
+                            timeout=(CONNECT_TIMEOUT, FIRST_TOKEN_TIMEOUT)) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            # SSE 的每個事件是一行 "data: {...}"，空行與註解行略過
+            if not line or not line.startswith(b"data:"):
+                continue
+            data = line[len(b"data:"):].strip()
+            if data == b"[DONE]":
+                break
+            chunk = json.loads(data.decode("utf-8"))
+            choices = chunk.get("choices") or []
+            if not choices:
+                continue
+            piece = (choices[0].get("delta") or {}).get("content")
+            if piece:
+                yield piece
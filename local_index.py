@@ -0,0 +1,115 @@
+import threading
+import time
+
+import numpy as np
+from qdrant_client.http.models import ScoredPoint
+
+
+# 小型 collection 的本地向量索引（例如只有幾十筆的 FAQ 字典）
+# 啟動時把整個 collection 的向量與 payload 從 Qdrant 載入成正規化的 NumPy 矩陣，
+# 查詢只需要一次矩陣乘法，不必再經過網路；Qdrant 仍是唯一的資料來源：
+# - 每隔 refresh_interval 秒在背景重新載入一次（重新載入失敗時沿用舊資料）
+# - points 數超過 max_points 時停用本地索引，改回使用 Qdrant 查詢
+# 呼叫端每次查詢前（不論索引目前是否可用）都應呼叫 maybe_refresh()：
+# 第一次載入失敗或曾超過 max_points 的索引，之後 collection 恢復正常時才會重新啟用
+class LocalCollectionIndex:
+    def __init__(self, client, collection_name: str, max_points: int = 5000, refresh_interval: float = 60.0):
+        self.client = client
+        self.collection_name = collection_name
+        self.max_points = max_points
+        self.refresh_interval = refresh_interval
+        self._ids = []
+        self._payloads = []
+        self._matrix = None  # 正規化後的向量，None 表示目前不可使用
+        self._loaded_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    # 目前是否可以用本地索引回答
+    @property
+    def ready(self) -> bool:
+        return self._matrix is not None
+
+    # 從 Qdrant 重新載入；collection 太大時停用本地索引
+    def refresh(self) -> bool:
+        try:
+            count = self.client.count(collection_name=self.collection_name, exact=True).count
+            if count > self.max_points:
+                if self._matrix is not None:
+                    print(f"❗ {self.collection_name} 有 {count} 筆，超過 {self.max_points}，改用 Qdrant 查詢")
+                with self._lock:
+                    self._ids, self._payloads, self._matrix = [], [], None
+                    self._loaded_at = time.monotonic()
+                return False
+
+            ids, payloads, vectors = [], [], []
+            offset = None
+            while True:
+                points, offset = self.client.scroll(
+                    collection_name=self.collection_name,
+                    limit=256,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=True
+                )
+                for p in points:
+                    ids.append(p.id)
+                    payloads.append(p.payload or {})
+                    vectors.append(p.vector)
+                if offset is None:
+                    break
+
+            matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            with self._lock:
+                self._ids, self._payloads, self._matrix = ids, payloads, matrix / norms
+                self._loaded_at = time.monotonic()
+            print(f"✅ 已載入本地索引 {self.collection_name}：{len(ids)} 筆")
+            return True
+        except Exception as e:
+            # Qdrant 暫時連不上 → 沿用目前的資料，稍後再試
+            print(f"❗ 重新載入 {self.collection_name} 失敗，沿用舊資料：{e}")
+            with self._lock:
+                self._loaded_at = time.monotonic()
+            return False
+
+    # 到期時在背景重新載入，不阻塞查詢
+    def maybe_refresh(self):
+        if time.monotonic() - self._loaded_at < self.refresh_interval:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name=f"local-index-{self.collection_name}", daemon=True).start()
+
+    # 以 cosine similarity 查詢，回傳格式與 client.search(with_vectors=True) 相同（ScoredPoint 清單，vector 為正規化後的向量）
+    def search(self, vector, limit: int):
+        self.maybe_refresh()
+        with self._lock:
+            matrix, ids, payloads = self._matrix, self._ids, self._payloads
+        if matrix is None:
+            raise RuntimeError(f"{self.collection_name} 的本地索引尚未可用")
+        if matrix.shape[0] == 0 or limit <= 0:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        scores = matrix @ query
+        limit = min(limit, scores.shape[0])
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [
+            ScoredPoint(id=ids[i], version=0, score=float(scores[i]), payload=payloads[i], vector=matrix[i].tolist())
+            for i in top
+        ]
@@ -0,0 +1,151 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# 輕量的效能統計（histogram、counter、gauge），輸出成 Prometheus 文字格式給 /metrics 使用
+# 用法：
+#   with metrics.timer("rag_stage_seconds", stage="encode"):
+#       ...
+#   metrics.inc("rag_threshold_total", source="faq", result="hit")
+#   metrics.add_gauge("answer_cache", "回答快取狀態", lambda: answer_cache.stats())
+
+# 延遲的分桶上限（秒），涵蓋 encode 的毫秒級到 LLM 生成的數十秒
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+# 把 labels 轉成固定順序的 tuple，當作 dict 的 key
+def _label_key(labels: dict):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    escaped = [(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in items]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms = {}  # name -> {label_key: _Histogram}
+        self._counters = {}  # name -> {label_key: 數值}
+        self._gauges = {}  # name -> (說明, 取值函式)
+        self._help = {}
+        self._observers = []  # 每次 observe 都會呼叫的函式（例如壓測時收集原始數值）
+
+    # 設定指標的說明文字（輸出在 # HELP）
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    # 記錄一次耗時（秒）
+    def observe(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self.buckets)
+            histogram.observe(value)
+        for observer in self._observers:
+            observer(name, value, labels)
+
+    # 計數器加一（或加 amount）
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    # 計時區塊，結束時自動 observe
+    @contextmanager
+    def timer(self, name: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    # 註冊 observer：fn(name, value, labels)，每次 observe 時呼叫
+    def add_observer(self, fn):
+        self._observers.append(fn)
+
+    def remove_observer(self, fn):
+        self._observers.remove(fn)
+
+    # 註冊 gauge：fn 回傳數值，或 {欄位: 數值} 的 dict（每個欄位輸出成一個 field label）
+    def add_gauge(self, name: str, help_text: str, fn):
+        self._gauges[name] = (help_text, fn)
+
+    # 輸出 Prometheus 文字格式
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            histograms = {name: {k: (list(h.counts), h.count, h.sum) for k, h in series.items()}
+                          for name, series in self._histograms.items()}
+            counters = {name: dict(series) for name, series in self._counters.items()}
+
+        for name in sorted(histograms):
+            lines.append(f"# HELP {name} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, (counts, count, total) in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', repr(float(bound)))])} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+
+        for name in sorted(counters):
+            lines.append(f"# HELP {name} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+
+        for name in sorted(self._gauges):
+            help_text, fn = self._gauges[name]
+            try:
+                value = fn()
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            if isinstance(value, dict):
+                for field, field_value in sorted(value.items()):
+                    if isinstance(field_value, bool) or not isinstance(field_value, (int, float)):
+                        continue
+                    lines.append(f"{name}{_format_labels((), [('field', field)])} {field_value}")
+            elif value is not None:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# 全程式共用的 registry 與捷徑函式
+registry = MetricsRegistry()
+describe = registry.describe
+observe = registry.observe
+inc = registry.inc
+timer = registry.timer
+add_gauge = registry.add_gauge
+add_observer = registry.add_observer
+remove_observer = registry.remove_observer
+render = registry.render
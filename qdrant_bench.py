@@ -0,0 +1,115 @@
+import argparse
+import json
+import time
+
+import numpy as np
+from qdrant_client.http import models
+
+from qdrant_collections import alias_target
+from qdrant_provision import get_client, profile_for
+
+# Qdrant 查詢參數的 recall / 延遲量測（協助選擇 qdrant_provision.py 中的 profile 設定）
+# 1. 從 collection 抽出 queries 筆向量，加上少量雜訊當作查詢
+# 2. 以 exact=True（暴力搜尋）的結果當作正確答案
+# 3. 對每組 hnsw_ef × oversampling（以及不使用 quantization）量測 recall@limit 與延遲
+# 用法：
+#   python qdrant_bench.py --collection rag_documents --queries 200 --ef 16 32 64 128 --oversampling 1 2 4
+#   python qdrant_bench.py --collection rag_documents --output qdrant_bench.json
+
+DEFAULT_EF = [16, 32, 64, 128]
+DEFAULT_OVERSAMPLING = [1.0, 2.0, 4.0]
+
+
+# 從 collection 隨機抽出向量並加上雜訊
+def sample_queries(client, collection_name: str, count: int, noise: float, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    total = client.count(collection_name=collection_name, exact=True).count
+    # 先讀出足夠的 point 再隨機抽樣（讀取數量有上限，避免大 collection 全部讀出）
+    pool, offset = [], None
+    while len(pool) < min(total, count * 10):
+        points, offset = client.scroll(collection_name=collection_name, limit=512, offset=offset,
+                                       with_payload=False, with_vectors=True)
+        pool.extend(p.vector for p in points)
+        if offset is None:
+            break
+    matrix = np.asarray(pool, dtype=np.float32)
+    picked = matrix[rng.choice(len(matrix), size=min(count, len(matrix)), replace=False)]
+    picked = picked / np.linalg.norm(picked, axis=1, keepdims=True)
+    picked += rng.normal(0, noise, picked.shape).astype(np.float32)
+    return picked
+
+
+def _query(client, collection_name: str, vector, limit: int, params):
+    return client.query_points(collection_name=collection_name, query=vector.tolist(), limit=limit,
+                               search_params=params, with_payload=False).points
+
+
+# 以一組查詢參數執行所有查詢，回傳 recall 與延遲
+def run_setting(client, collection_name: str, queries, truth, limit: int, params) -> dict:
+    latencies, recalls = [], []
+    for vector, expected in zip(queries, truth):
+        started = time.perf_counter()
+        hits = _query(client, collection_name, vector, limit, params)
+        latencies.append(time.perf_counter() - started)
+        if expected:
+            recalls.append(len({h.id for h in hits} & expected) / len(expected))
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "recall": round(float(np.mean(recalls)), 4) if recalls else None,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Qdrant 查詢參數的 recall / 延遲量測")
+    parser.add_argument("--collection", required=True, help="collection 或 alias 名稱")
+    parser.add_argument("--queries", type=int, default=100, help="查詢數")
+    parser.add_argument("--limit", type=int, default=5, help="每次取回的筆數（recall@limit）")
+    parser.add_argument("--noise", type=float, default=0.05, help="加在抽樣向量上的雜訊標準差")
+    parser.add_argument("--ef", type=int, nargs="+", default=DEFAULT_EF, help="要測試的 hnsw_ef")
+    parser.add_argument("--oversampling", type=float, nargs="+", default=DEFAULT_OVERSAMPLING,
+                        help="要測試的 oversampling（collection 有 quantization 時才會使用）")
+    parser.add_argument("--output", help="結果 JSON 檔")
+    args = parser.parse_args()
+
+    client = get_client()
+    collection_name = alias_target(client, args.collection) or args.collection
+    info = client.get_collection(collection_name)
+    quantized = info.config.quantization_config is not None
+    print(f"📊 {args.collection}（{collection_name}）：{info.points_count} 筆，"
+          f"quantization={'int8' if quantized else '無'}，profile={profile_for(args.collection)}")
+
+    queries = sample_queries(client, collection_name, args.queries, args.noise)
+    exact = models.SearchParams(exact=True)
+    truth = [{h.id for h in _query(client, collection_name, q, args.limit, exact)} for q in queries]
+    results = [{"setting": "exact", **run_setting(client, collection_name, queries, truth, args.limit, exact)}]
+
+    for ef in args.ef:
+        settings = [("hnsw", models.SearchParams(hnsw_ef=ef))]
+        if quantized:
+            settings = [("original vectors", models.SearchParams(
+                hnsw_ef=ef, quantization=models.QuantizationSearchParams(ignore=True)))]
+            for oversampling in args.oversampling:
+                settings.append((f"int8 rescore x{oversampling:g}", models.SearchParams(
+                    hnsw_ef=ef, quantization=models.QuantizationSearchParams(rescore=True, oversampling=oversampling)
+                )))
+        for label, params in settings:
+            result = run_setting(client, collection_name, queries, truth, args.limit, params)
+            results.append({"setting": label, "hnsw_ef": ef, **result})
+
+    print(f"{'設定':<24}{'hnsw_ef':>8}{'recall':>9}{'p50 ms':>10}{'p95 ms':>10}")
+    for row in results:
+        print(f"{row['setting']:<24}{str(row.get('hnsw_ef', '-')):>8}{str(row['recall']):>9}"
+              f"{row['p50_ms']:>10}{row['p95_ms']:>10}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"collection": args.collection, "target": collection_name, "points": info.points_count,
+                       "queries": len(queries), "limit": args.limit, "results": results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"✅ 結果已寫入：{args.output}")
+
+
+if __name__ == "__main__":
+    main()
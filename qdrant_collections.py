@@ -0,0 +1,87 @@
+import re
+from datetime import datetime
+
+from qdrant_client.http import models
+
+# 各 collection 名稱集中在這裡
+# 文件段落與典型問答由服務（UI_RAG.QdrantSearcher）透過 alias 查詢：
+#   重建時 qdrant_ingest.py 先建立新版本的 collection（<alias>_v<時間>），驗證完成後一次把 alias 切換過去，
+#   查詢不會看到新舊資料混在一起；舊版本保留下來，可用 rollback 立刻切回
+#   驗證通過的版本會在 collection metadata 記錄 validated（需要 Qdrant 1.16 以上），
+#   只有這些版本會被保留或切回（匯入中斷留下的不完整版本不算）
+# chat_history 由服務持續寫入，不做版本切換
+
+DOCUMENTS_ALIAS = "rag_documents"
+FAQ_ALIAS = "rag_faq"
+CHATLOG_COLLECTION = "chat_history_v2"
+LEGACY_CHATLOG_COLLECTION = "chat_history_v1"  # csv_to_qdrant_chatlog.py 匯入的舊對話紀錄
+
+# 改用 alias 之前實際使用的 collection：alias 還不存在時先指向這裡（bootstrap）
+LEGACY_COLLECTIONS = {
+    DOCUMENTS_ALIAS: "my_documents2-17v1",
+    FAQ_ALIAS: "QAdic_HV3",
+}
+
+
+# 新版本的 collection 名稱，例如 rag_documents_v20250101120000
+def version_name(alias: str, now: datetime = None) -> str:
+    return f"{alias}_v{(now or datetime.now()).strftime('%Y%m%d%H%M%S')}"
+
+
+# collection 是否存在（比對名稱字串，而不是 CollectionDescription 物件）
+def collection_exists(client, collection_name: str) -> bool:
+    if hasattr(client, "collection_exists"):
+        return client.collection_exists(collection_name)
+    return collection_name in [c.name for c in client.get_collections().collections]
+
+
+# alias 目前指向的 collection，alias 不存在時回傳 None
+def alias_target(client, alias: str):
+    for item in client.get_aliases().aliases:
+        if item.alias_name == alias:
+            return item.collection_name
+    return None
+
+
+# 此 alias 的所有版本（由舊到新）；validated_only=True 時只列出驗證通過的版本
+def list_versions(client, alias: str, validated_only: bool = False):
+    pattern = re.compile(rf"^{re.escape(alias)}_v\d{{14}}$")
+    versions = sorted(c.name for c in client.get_collections().collections if pattern.match(c.name))
+    if validated_only:
+        versions = [name for name in versions if is_validated(client, name)]
+    return versions
+
+
+# 記錄此版本已通過驗證
+def mark_validated(client, collection_name: str):
+    client.update_collection(collection_name=collection_name,
+                             metadata={"validated": True, "validated_at": datetime.now().isoformat(timespec="seconds")})
+
+
+def is_validated(client, collection_name: str) -> bool:
+    metadata = client.get_collection(collection_name).config.metadata or {}
+    return bool(metadata.get("validated"))
+
+
+# 在同一個請求中刪除舊 alias 並建立新 alias，Qdrant 會一次套用（查詢不會遇到 alias 不存在的瞬間）
+def swap_alias(client, alias: str, collection_name: str):
+    operations = []
+    if alias_target(client, alias) is not None:
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+    operations.append(models.CreateAliasOperation(
+        create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias)
+    ))
+    client.update_collection_aliases(change_aliases_operations=operations)
+    print(f"🔀 {alias} → {collection_name}")
+
+
+# alias 不存在但舊的 collection 存在時，建立 alias 指向舊 collection；回傳 alias 目前指向的 collection
+def bootstrap_alias(client, alias: str):
+    target = alias_target(client, alias)
+    if target is not None:
+        return target
+    legacy = LEGACY_COLLECTIONS.get(alias)
+    if legacy and collection_exists(client, legacy):
+        swap_alias(client, alias, legacy)
+        return legacy
+    return None
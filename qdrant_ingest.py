@@ -0,0 +1,360 @@
+import argparse
+import hashlib
+import os
+import uuid
+
+import pandas as pd
+from qdrant_client.http.models import PointIdsList, PointStruct
+from embedding_cache import EmbeddingStore
+from encoders import load_encoder
+from qdrant_collections import (DOCUMENTS_ALIAS, FAQ_ALIAS, LEGACY_CHATLOG_COLLECTION, LEGACY_COLLECTIONS,
+                                alias_target, bootstrap_alias, collection_exists, is_validated, list_versions,
+                                mark_validated, swap_alias, version_name)
+from qdrant_provision import ensure_collection, get_client
+
+# 統一的 CSV → Qdrant 匯入工具
+# 取代原本 csv_to_qdrant.py / csv_to_qdrant_QAv1.py / csv_to_qdrant_chatlog.py 逐筆 encode、逐筆 upsert 的做法：
+# 1. CSV 分段（chunk）讀入
+# 2. 一段內的文字一次批次 encode
+# 3. 以批次（可平行）upload 到 Qdrant
+# 4. point id 由內容雜湊產生，內容沒變的資料重跑時會直接略過
+# 5. encode 經過 embedding_cache，曾經 encode 過的文字（例如改到 collection 名稱重建）不必重算
+# 文件段落與典型問答預設以 rebuild 重建：寫入新版本 collection → 驗證 → 切換 alias（見 qdrant_collections.py）
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DIMENSION = 384
+
+# 產生 point id 用的命名空間（固定值，讓相同內容永遠得到相同 id）
+ID_NAMESPACE = uuid.UUID("6f1c2a4e-3b7d-4f1a-9c55-2d8e0b7a1c90")
+
+
+# 把 CSV 欄位值轉成乾淨字串（NaN 視為空字串）
+def _clean(value) -> str:
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ""
+    return str(value).strip()
+
+
+# 各種來源的欄位格式：回傳 (要 encode 的文字, payload)，不需要的列回傳 None
+
+# 原始文件段落：將這一列所有欄位合併成一段文字
+def _document_row(row: dict):
+    values = [_clean(v) for v in row.values()]
+    chunk_text = " ".join(v for v in values if v)
+    if not chunk_text:
+        return None
+    return chunk_text, {"chunk_text": chunk_text}
+
+
+# 典型問答：只 encode 問題，答案放在 payload
+def _faq_row(row: dict):
+    question = _clean(row.get("question"))
+    answer = _clean(row.get("answer"))
+    if not question:
+        return None
+    return question, {"question": question, "answer": answer}
+
+
+# 對話紀錄：encode 使用者問題，payload 保留時間與 AI 回答
+def _chatlog_row(row: dict):
+    timestamp = _clean(row.get("timestamp"))
+    user_question = _clean(row.get("user_question"))
+    ai_answer = _clean(row.get("ai_answer"))
+    if not user_question:
+        return None
+    return user_question, {"timestamp": timestamp, "user_question": user_question, "ai_answer": ai_answer}
+
+
+# folder：預設讀取的資料夾；encoding：CSV 編碼
+# alias：服務查詢用的 alias（以版本切換方式重建）；collection：沒有 alias 的來源直接寫入的 collection
+SOURCES = {
+    "documents": {
+        "folder": os.path.join(BASE_DIR, "CSV_v3"),
+        "alias": DOCUMENTS_ALIAS,
+        "encoding": "utf-8",
+        "build": _document_row,
+    },
+    "faq": {
+        "folder": os.path.join(BASE_DIR, "CSV_QAHv1"),
+        "alias": FAQ_ALIAS,
+        "encoding": "utf-8",
+        "build": _faq_row,
+    },
+    "chatlog": {
+        "folder": os.path.join(BASE_DIR, "CSV_chatlog"),
+        "collection": LEGACY_CHATLOG_COLLECTION,
+        "encoding": "utf-8-sig",
+        "build": _chatlog_row,
+    },
+}
+
+
+# 載入模型（backend 由環境變數決定，外面包一層向量快取）
+def load_model():
+    encoder = load_encoder()
+    return EmbeddingStore(encoder, encoder.name, dimension=DIMENSION)
+
+
+# 由來源名稱與 payload 內容產生穩定的 point id
+def content_id(source: str, payload: dict) -> str:
+    content = "\x1f".join(f"{k}={payload[k]}" for k in sorted(payload))
+    digest = hashlib.sha1(f"{source}\x1e{content}".encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(ID_NAMESPACE, digest))
+
+
+# 取出 collection 中已經存在的所有 point id：{字串形式: 原本的 id}
+# 舊版匯入程式留下的是整數 id，比對時用字串，刪除時要用原本的值
+def existing_ids(client, collection_name: str, page_size: int = 1000) -> dict:
+    ids = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=page_size,
+            offset=offset,
+            with_payload=False,
+            with_vectors=False
+        )
+        ids.update((str(p.id), p.id) for p in points)
+        if offset is None:
+            return ids
+
+
+# 逐一讀出資料夾內 CSV 的每一列（分段讀取，不會一次把大檔載入記憶體）
+def iter_rows(folder: str, encoding: str, chunk_size: int):
+    for filename in sorted(os.listdir(folder)):
+        if not filename.endswith(".csv"):
+            continue
+        filepath = os.path.join(folder, filename)
+        print(f"➡ 正在讀取：{filepath}")
+        for chunk in pd.read_csv(filepath, encoding=encoding, chunksize=chunk_size):
+            chunk.columns = [str(c).strip() for c in chunk.columns]
+            yield from chunk.to_dict("records")
+
+
+# 匯入單一來源（直接寫入既有的 collection）
+# collection_name 未指定時：沒有 alias 的來源寫入 spec["collection"]，有 alias 的來源寫入 alias 目前指向的 collection
+# batch_size：每次 upload 的 point 數；parallel：平行上傳的 worker 數
+# chunk_size：每次讀入並 encode 的列數；prune：刪除 CSV 中已不存在的舊 point
+def ingest_source(source: str, folder: str = None, collection_name: str = None,
+                  client=None, model=None, batch_size: int = 256, parallel: int = 1,
+                  chunk_size: int = 1000, prune: bool = False) -> dict:
+    spec = SOURCES[source]
+    folder = folder or spec["folder"]
+    client = client or get_client()
+    if collection_name is None:
+        collection_name = spec.get("collection") or bootstrap_alias(client, spec["alias"])
+        if collection_name is None:
+            raise RuntimeError(f"{spec['alias']} 尚未建立，請先執行 python qdrant_ingest.py {source} 建立第一個版本")
+    model = model or load_model()
+
+    ensure_collection(client, collection_name, dimension=DIMENSION)
+    known_ids = existing_ids(client, collection_name)
+    seen_ids = set()
+    stats = {"rows": 0, "skipped": 0, "uploaded": 0, "deleted": 0}
+
+    texts, payloads, ids = [], [], []
+
+    # 把目前累積的新資料批次 encode 後上傳
+    def flush():
+        if not texts:
+            return
+        vectors = model.encode(texts)
+        points = [
+            PointStruct(id=point_id, vector=vector.tolist(), payload=payload)
+            for point_id, vector, payload in zip(ids, vectors, payloads)
+        ]
+        client.upload_points(
+            collection_name=collection_name,
+            points=points,
+            batch_size=batch_size,
+            parallel=parallel,
+            wait=True
+        )
+        stats["uploaded"] += len(points)
+        print(f"✅ 已上傳 {stats['uploaded']} 筆")
+        texts.clear()
+        payloads.clear()
+        ids.clear()
+
+    for row in iter_rows(folder, spec["encoding"], chunk_size):
+        built = spec["build"](row)
+        if built is None:
+            continue
+        text, payload = built
+        stats["rows"] += 1
+        point_id = content_id(source, payload)
+        # 內容沒變（id 已存在）或同一次匯入中重複的資料 → 略過
+        if point_id in known_ids or point_id in seen_ids:
+            seen_ids.add(point_id)
+            stats["skipped"] += 1
+            continue
+        seen_ids.add(point_id)
+        texts.append(text)
+        payloads.append(payload)
+        ids.append(point_id)
+        if len(texts) >= chunk_size:
+            flush()
+    flush()
+
+    # CSV 中已刪除或修改過的舊資料，從 collection 移除（刪除數以前後的筆數差計算）
+    if prune:
+        stale_ids = [point_id for key, point_id in known_ids.items() if key not in seen_ids]
+        if stale_ids:
+            before = client.count(collection_name=collection_name, exact=True).count
+            for start in range(0, len(stale_ids), batch_size):
+                client.delete(collection_name=collection_name,
+                              points_selector=PointIdsList(points=stale_ids[start:start + batch_size]))
+            stats["deleted"] = before - client.count(collection_name=collection_name, exact=True).count
+
+    print(f"🎉 {source} → {collection_name}：共 {stats['rows']} 筆，"
+          f"新增 {stats['uploaded']} 筆，略過 {stats['skipped']} 筆，刪除 {stats['deleted']} 筆")
+    return stats
+
+
+# 檢查新版本：筆數與上傳數一致、與目前版本相比沒有大幅減少，並抽查幾筆向量能查回自己
+def validate_version(client, collection_name: str, expected: int, previous: str = None,
+                     min_ratio: float = 0.5, spot_checks: int = 5):
+    count = client.count(collection_name=collection_name, exact=True).count
+    if count == 0 or count != expected:
+        raise RuntimeError(f"{collection_name} 筆數不符：預期 {expected}，實際 {count}")
+    if previous:
+        previous_count = client.count(collection_name=previous, exact=True).count
+        if count < previous_count * min_ratio:
+            raise RuntimeError(f"{collection_name} 只有 {count} 筆，少於目前版本 {previous}（{previous_count} 筆）的 "
+                               f"{min_ratio:.0%}，可加上 --force 略過此檢查")
+
+    points, _ = client.scroll(collection_name=collection_name, limit=spot_checks, with_vectors=True)
+    for point in points:
+        if hasattr(client, "query_points"):
+            hits = client.query_points(collection_name=collection_name, query=point.vector, limit=1).points
+        else:
+            hits = client.search(collection_name=collection_name, query_vector=point.vector, limit=1)
+        if not hits or hits[0].score < 0.99:
+            raise RuntimeError(f"{collection_name} 抽查失敗：point {point.id} 查不回相同的向量")
+    print(f"🔍 {collection_name} 驗證通過：{count} 筆，抽查 {len(points)} 筆")
+
+
+# 以版本切換方式重建有 alias 的來源：
+# 1. 匯入到新的 collection（<alias>_v<時間>），服務仍查詢舊版本
+# 2. validate_version 通過後標記為已驗證並一次切換 alias；匯入或驗證失敗（包含 Ctrl-C）時刪除新版本、alias 不動
+# 3. 只保留最新的 keep 個已驗證版本（包含剛切換過去的，舊的可用 rollback 切回），
+#    比目前版本舊、未通過驗證的殘留版本一併刪除；改用 alias 之前的舊 collection 不會刪除
+def rebuild_source(source: str, folder: str = None, client=None, model=None, batch_size: int = 256,
+                   parallel: int = 1, chunk_size: int = 1000, keep: int = 2, min_ratio: float = 0.5,
+                   spot_checks: int = 5, force: bool = False) -> dict:
+    spec = SOURCES[source]
+    alias = spec.get("alias")
+    if alias is None:
+        raise ValueError(f"{source} 沒有設定 alias，請直接使用 ingest_source")
+    client = client or get_client()
+    previous = bootstrap_alias(client, alias)
+    # 目前服務中的版本一定通過了驗證（加入 metadata 標記之前建立的版本在這裡補上）
+    if previous in list_versions(client, alias) and not is_validated(client, previous):
+        mark_validated(client, previous)
+    collection_name = version_name(alias)
+    # 同一秒內重複重建會得到相同名稱，不能寫進（或失敗時刪掉）既有的版本
+    if collection_exists(client, collection_name):
+        raise RuntimeError(f"{collection_name} 已存在，請稍後再重建")
+
+    try:
+        stats = ingest_source(source, folder=folder, collection_name=collection_name, client=client, model=model,
+                              batch_size=batch_size, parallel=parallel, chunk_size=chunk_size)
+        validate_version(client, collection_name, stats["uploaded"], None if force else previous,
+                         min_ratio, spot_checks)
+        mark_validated(client, collection_name)
+    except BaseException:
+        if collection_exists(client, collection_name):
+            client.delete_collection(collection_name=collection_name)
+            print(f"🗑 重建失敗，已刪除未完成的版本：{collection_name}")
+        raise
+
+    swap_alias(client, alias, collection_name)
+    validated = list_versions(client, alias, validated_only=True)
+    stale = validated[:-keep] if keep > 0 else []
+    stale += [name for name in list_versions(client, alias) if name < collection_name and name not in validated]
+    for old in stale:
+        if old != collection_name:
+            client.delete_collection(collection_name=old)
+            print(f"🗑 已刪除舊版本：{old}")
+    stats.update({"collection": collection_name, "previous": previous})
+    return stats
+
+
+# 把 alias 切回上一個已驗證的版本（沒有更舊的版本時切回改用 alias 之前的舊 collection）
+def rollback(alias: str, client=None) -> str:
+    client = client or get_client()
+    current = alias_target(client, alias)
+    versions = list_versions(client, alias)
+    older = [name for name in list_versions(client, alias, validated_only=True) if name < current] \
+        if current in versions else []
+    legacy = LEGACY_COLLECTIONS.get(alias)
+    if older:
+        target = older[-1]
+    elif legacy and current in versions and collection_exists(client, legacy):
+        target = legacy
+    else:
+        raise RuntimeError(f"{alias} 沒有可以切回的版本（目前：{current}）")
+    swap_alias(client, alias, target)
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批次、增量匯入 CSV 到 Qdrant")
+    parser.add_argument("source", choices=sorted(SOURCES) + ["all"], help="資料來源種類")
+    parser.add_argument("--folder", help="CSV 資料夾（預設依來源而定）")
+    parser.add_argument("--collection", help="寫入的 collection 名稱（預設依來源而定）")
+    parser.add_argument("--batch-size", type=int, default=256, help="每次上傳的 point 數")
+    parser.add_argument("--parallel", type=int, default=1, help="平行上傳的 worker 數")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="每次讀入並 encode 的列數")
+    parser.add_argument("--prune", action="store_true", help="刪除 CSV 中已不存在的舊資料")
+    parser.add_argument("--in-place", action="store_true", help="有 alias 的來源也直接寫入目前的版本（不重建）")
+    parser.add_argument("--keep", type=int, default=2, help="重建後保留的版本數")
+    parser.add_argument("--min-ratio", type=float, default=0.5, help="新版本筆數至少要是目前版本的多少比例")
+    parser.add_argument("--force", action="store_true", help="略過與目前版本的筆數比較")
+    parser.add_argument("--rollback", action="store_true", help="把 alias 切回上一個版本")
+    args = parser.parse_args()
+
+    sources = sorted(SOURCES) if args.source == "all" else [args.source]
+    if len(sources) > 1 and (args.folder or args.collection):
+        parser.error("--folder / --collection 只能搭配單一來源使用")
+
+    client = get_client()
+    if args.rollback:
+        for source in sources:
+            if SOURCES[source].get("alias"):
+                rollback(SOURCES[source]["alias"], client)
+        return
+
+    model = load_model()
+    for source in sources:
+        # 有 alias 的來源預設建立新版本再切換，指定 --collection 或 --in-place 時才直接寫入
+        if SOURCES[source].get("alias") and not (args.collection or args.in_place):
+            rebuild_source(
+                source,
+                folder=args.folder,
+                client=client,
+                model=model,
+                batch_size=args.batch_size,
+                parallel=args.parallel,
+                chunk_size=args.chunk_size,
+                keep=args.keep,
+                min_ratio=args.min_ratio,
+                force=args.force
+            )
+            continue
+        ingest_source(
+            source,
+            folder=args.folder,
+            collection_name=args.collection,
+            client=client,
+            model=model,
+            batch_size=args.batch_size,
+            parallel=args.parallel,
+            chunk_size=args.chunk_size,
+            prune=args.prune
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import argparse
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+from qdrant_collections import (CHATLOG_COLLECTION, DOCUMENTS_ALIAS, FAQ_ALIAS, LEGACY_CHATLOG_COLLECTION,
+                                LEGACY_COLLECTIONS, alias_target, collection_exists)
+
+# 所有程式共用的 Qdrant 連線與 collection 建立方式
+# - get_client()：連線設定由環境變數決定，可改用 gRPC（QDRANT_PREFER_GRPC=1，大量上傳與查詢較快）
+# - 每種資料有一份 CollectionProfile（HNSW 參數、int8 scalar quantization、向量 / payload 是否放在磁碟、payload index），
+#   建立 collection 時依 profile 設定；既有的 collection 可用 apply 套用
+# - search_params()：查詢時使用的 hnsw_ef 與 quantization rescore 設定
+# 用法：
+#   python qdrant_provision.py show                    # 列出各 collection 目前的設定與對應的 profile
+#   python qdrant_provision.py apply rag_documents     # 把 profile 套用到既有的 collection（alias 會先解析）
+# 選擇參數時可用 qdrant_bench.py 量測 recall 與延遲
+
+QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
+QDRANT_PORT = int(os.getenv("QDRANT_PORT", "32768"))
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "0") == "1"
+
+DIMENSION = 384
+
+
+# 建立連線（參數未指定時使用環境變數）
+def get_client(host: str = None, port: int = None, prefer_grpc: bool = None, grpc_port: int = None) -> QdrantClient:
+    return QdrantClient(
+        host=host or QDRANT_HOST,
+        port=port or QDRANT_PORT,
+        grpc_port=grpc_port or QDRANT_GRPC_PORT,
+        prefer_grpc=QDRANT_PREFER_GRPC if prefer_grpc is None else prefer_grpc
+    )
+
+
+# 一種 collection 的設定
+# hnsw_m / hnsw_ef_construct：建索引的參數（越大 recall 越高，建索引越慢、記憶體越多）
+# search_ef：查詢時的 hnsw_ef（None 表示使用 Qdrant 預設值）
+# quantization：是否使用 int8 scalar quantization（量化後的向量放在記憶體，原始向量可放磁碟）
+# oversampling：使用 quantization 時先多取幾倍候選，再以原始向量 rescore
+# on_disk_vectors / on_disk_payload：原始向量 / payload 是否放在磁碟
+# payload_indexes：{欄位: PayloadSchemaType}
+@dataclass
+class CollectionProfile:
+    hnsw_m: int = 16
+    hnsw_ef_construct: int = 100
+    search_ef: Optional[int] = None
+    quantization: bool = False
+    oversampling: float = 2.0
+    on_disk_vectors: bool = False
+    on_disk_payload: bool = False
+    payload_indexes: Dict[str, models.PayloadSchemaType] = field(default_factory=dict)
+
+
+PROFILES = {
+    # 文件段落：資料量最大、會持續成長；量化向量放記憶體，原始向量與 payload 放磁碟
+    "documents": CollectionProfile(hnsw_m=16, hnsw_ef_construct=128, search_ef=64, quantization=True,
+                                   oversampling=2.0, on_disk_vectors=True, on_disk_payload=True),
+    # 典型問答：只有幾十到幾百筆，全部放記憶體（服務也會載入成本地索引）
+    "faq": CollectionProfile(),
+    # 服務寫入的對話紀錄：以 ts 做保存期限的篩選
+    "chatlog": CollectionProfile(payload_indexes={"ts": models.PayloadSchemaType.FLOAT}),
+    # csv_to_qdrant_chatlog.py 匯入的舊對話紀錄
+    "legacy_chatlog": CollectionProfile(on_disk_payload=True,
+                                        payload_indexes={"timestamp": models.PayloadSchemaType.KEYWORD}),
+}
+
+_ALIAS_PROFILES = {DOCUMENTS_ALIAS: "documents", FAQ_ALIAS: "faq"}
+
+
+# collection（或 alias、alias 的版本、改用 alias 之前的舊名稱）對應的 profile，沒有對應時回傳預設值
+def profile_for(collection_name: str) -> CollectionProfile:
+    if collection_name == CHATLOG_COLLECTION:
+        return PROFILES["chatlog"]
+    if collection_name == LEGACY_CHATLOG_COLLECTION:
+        return PROFILES["legacy_chatlog"]
+    for alias, profile_name in _ALIAS_PROFILES.items():
+        if collection_name in (alias, LEGACY_COLLECTIONS.get(alias)) or collection_name.startswith(f"{alias}_v"):
+            return PROFILES[profile_name]
+    return CollectionProfile()
+
+
+def _quantization_config(profile: CollectionProfile):
+    if not profile.quantization:
+        return None
+    return models.ScalarQuantization(
+        scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+    )
+
+
+# 查詢參數；沒有需要調整的設定時回傳 None（使用 Qdrant 預設值）
+def search_params(profile: CollectionProfile) -> Optional[models.SearchParams]:
+    if profile.search_ef is None and not profile.quantization:
+        return None
+    quantization = None
+    if profile.quantization:
+        quantization = models.QuantizationSearchParams(rescore=True, oversampling=profile.oversampling)
+    return models.SearchParams(hnsw_ef=profile.search_ef, quantization=quantization)
+
+
+# 建立 payload index（已存在時 Qdrant 會直接略過；記憶體模式不支援時只印出提示）
+def ensure_payload_indexes(client, collection_name: str, profile: CollectionProfile = None):
+    profile = profile or profile_for(collection_name)
+    for field_name, schema in profile.payload_indexes.items():
+        try:
+            client.create_payload_index(collection_name=collection_name, field_name=field_name, field_schema=schema)
+        except Exception as e:
+            print(f"❗ 無法建立 {collection_name}.{field_name} 的 payload index：{e}")
+
+
+# 若 collection 不存在就依 profile 建立，並確認 payload index；回傳是否新建立
+def ensure_collection(client, collection_name: str, profile: CollectionProfile = None,
+                      dimension: int = DIMENSION) -> bool:
+    profile = profile or profile_for(collection_name)
+    created = False
+    if not collection_exists(client, collection_name):
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config=models.VectorParams(size=dimension, distance=models.Distance.COSINE,
+                                               on_disk=profile.on_disk_vectors),
+            hnsw_config=models.HnswConfigDiff(m=profile.hnsw_m, ef_construct=profile.hnsw_ef_construct),
+            quantization_config=_quantization_config(profile),
+            on_disk_payload=profile.on_disk_payload
+        )
+        print(f"📌 已建立 Collection：{collection_name}")
+        created = True
+    ensure_payload_indexes(client, collection_name, profile)
+    return created
+
+
+# 把 profile 套用到既有的 collection（HNSW、quantization、向量是否放磁碟會由 Qdrant 在背景重建）
+# on_disk_payload 只能在建立時設定，需要改變時請以 qdrant_ingest.py 重建新版本
+def apply_profile(client, collection_name: str, profile: CollectionProfile = None):
+    profile = profile or profile_for(collection_name)
+    client.update_collection(
+        collection_name=collection_name,
+        vectors_config={"": models.VectorParamsDiff(on_disk=profile.on_disk_vectors)},
+        hnsw_config=models.HnswConfigDiff(m=profile.hnsw_m, ef_construct=profile.hnsw_ef_construct),
+        quantization_config=_quantization_config(profile) or models.Disabled.DISABLED
+    )
+    ensure_payload_indexes(client, collection_name, profile)
+    print(f"✅ 已套用設定：{collection_name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Qdrant collection 設定")
+    parser.add_argument("command", choices=["show", "apply"])
+    parser.add_argument("collections", nargs="*", help="collection 或 alias 名稱（apply 必填）")
+    args = parser.parse_args()
+
+    client = get_client()
+    if args.command == "apply":
+        if not args.collections:
+            parser.error("apply 需要指定 collection")
+        for name in args.collections:
+            apply_profile(client, alias_target(client, name) or name, profile_for(name))
+        return
+
+    names = args.collections or sorted(c.name for c in client.get_collections().collections)
+    for name in names:
+        target = alias_target(client, name) or name
+        info = client.get_collection(target)
+        params = info.config.params
+        print(f"{name}{' → ' + target if target != name else ''}：{info.points_count} 筆")
+        print(f"  hnsw={info.config.hnsw_config}  quantization={info.config.quantization_config}")
+        print(f"  vectors={params.vectors}  on_disk_payload={params.on_disk_payload}")
+        print(f"  payload_schema={list((info.payload_schema or {}).keys())}  profile={profile_for(name)}")
+
+
+if __name__ == "__main__":
+    main()
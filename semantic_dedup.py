@@ -0,0 +1,69 @@
+import numpy as np
+
+# 語意去重（向量化、分塊計算）
+# 與原本 data_clean .py 的規則相同（keep-first）：
+#   依序檢查每一段，只要與「已保留」的任一段 cosine similarity > threshold 就視為重複，
+#   並記錄它被併入的是哪一段（已保留段落中依序第一個超過門檻者）
+# 差別在於一次處理一個 block 的段落，用矩陣乘法取代逐對 util.cos_sim，
+# 且相似度矩陣最大只有 block_size × block_size，記憶體用量有上限
+
+
+# 將向量正規化成單位長度，之後內積即為 cosine similarity
+def normalize(embeddings) -> np.ndarray:
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+# embeddings：(n, d) 向量矩陣（未正規化也可以）
+# threshold：相似度超過此值視為重複
+# block_size：每次一起計算的段落數，決定相似度矩陣的最大大小
+# 回傳 (keep, merged_into)：
+#   keep：保留下來的列索引（依原順序）
+#   merged_into：{被移除的列索引: 併入的保留列索引}
+def dedup_embeddings(embeddings, threshold: float = 0.9, block_size: int = 1024):
+    matrix = normalize(embeddings)
+    n, dim = matrix.shape
+    # 已保留的向量依序存在預先配置好的矩陣中，避免反覆串接
+    kept_vectors = np.empty((n, dim), dtype=np.float32)
+    kept_rows = np.empty(n, dtype=np.int64)
+    kept_count = 0
+    merged_into = {}
+
+    for start in range(0, n, block_size):
+        block = matrix[start:start + block_size]
+        size = block.shape[0]
+
+        # 1. 與之前 block 已保留的段落比對，分塊計算並取第一個超過門檻的保留段落
+        prior_kept = kept_count
+        first_match = np.full(size, -1, dtype=np.int64)
+        for kept_start in range(0, prior_kept, block_size):
+            kept_end = min(kept_start + block_size, prior_kept)
+            unresolved = first_match < 0
+            if not unresolved.any():
+                break
+            sims = block[unresolved] @ kept_vectors[kept_start:kept_end].T
+            hits = sims > threshold
+            has_hit = hits.any(axis=1)
+            positions = np.flatnonzero(unresolved)[has_hit]
+            first_match[positions] = kept_start + hits[has_hit].argmax(axis=1)
+
+        # 2. 同一個 block 內依序判斷（只需比對 block 內較前面且被保留的段落）
+        intra = block @ block.T > threshold
+        block_kept = np.zeros(size, dtype=bool)
+        for i in range(size):
+            if first_match[i] >= 0:
+                merged_into[start + i] = int(kept_rows[first_match[i]])
+                continue
+            earlier = np.flatnonzero(block_kept[:i] & intra[i, :i])
+            if earlier.size:
+                merged_into[start + i] = start + int(earlier[0])
+                continue
+            block_kept[i] = True
+            kept_vectors[kept_count] = block[i]
+            kept_rows[kept_count] = start + i
+            kept_count += 1
+
+    keep = kept_rows[:kept_count].tolist()
+    return keep, merged_into
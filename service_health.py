@@ -0,0 +1,55 @@
+import threading
+import time
+
+
+# 各相依元件（encoder、Qdrant、LM Studio…）的狀態紀錄
+# 每個元件的狀態為 pending（尚未檢查）/ ok / error，並記錄檢查耗時與錯誤訊息
+class HealthRegistry:
+    def __init__(self, components):
+        self._lock = threading.Lock()
+        self._state = {
+            name: {"status": "pending", "detail": None, "latency_ms": None, "checked_at": None}
+            for name in components
+        }
+        self._checks = {}
+
+    # 註冊元件的檢查函式（回傳值會記錄在 detail，丟出例外視為 error）
+    def register(self, name: str, check):
+        with self._lock:
+            self._checks[name] = check
+            self._state.setdefault(name, {"status": "pending", "detail": None, "latency_ms": None, "checked_at": None})
+
+    # 執行某個元件的檢查並更新狀態
+    def run(self, name: str) -> bool:
+        started = time.perf_counter()
+        try:
+            detail = self._checks[name]()
+            status = "ok"
+        except Exception as e:
+            detail = f"{type(e).__name__}: {e}"
+            status = "error"
+        with self._lock:
+            self._state[name] = {
+                "status": status,
+                "detail": detail,
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+                "checked_at": time.time(),
+            }
+        return status == "ok"
+
+    # 距離上次檢查超過 max_age 秒（或從未檢查）的元件重新檢查
+    def refresh(self, names, max_age: float):
+        now = time.time()
+        for name in names:
+            checked_at = self._state[name]["checked_at"]
+            if checked_at is None or now - checked_at > max_age:
+                self.run(name)
+
+    # 所有指定元件是否都正常
+    def ready(self, names) -> bool:
+        with self._lock:
+            return all(self._state[name]["status"] == "ok" for name in names)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: dict(state) for name, state in self._state.items()}